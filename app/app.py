@@ -1,17 +1,22 @@
 # app/app.py
 
 import os
+import logging
 import gradio as gr
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 
 from app.local_llm_reader import get_llm
 from models.rag import RAGPipeline
-from vectorstore.index import build_index
+from models.async_rag import AsyncRAGPipeline
+from models.answer_cache import AnswerCache
+from vectorstore.index import publish_index, update_shards
+from vectorstore.retriever import FAISSRetriever
 from app.helper import (
     handle_query,
     apply_suggestion,
     generate_document,
+    export_metrics,
     handle_feedback,
     handle_vote
 )
@@ -20,27 +25,49 @@ from visualization.visualize import generate_rag_flowchart
 
 # === CONFIGURATION ===
 DATA_DIR = "data/VectorDB-Data-Folder"
-INDEX_PATH = "faiss_index.idx"
-METADATA_PATH = "metadata.pkl"
+INDEX_ROOT = "vector_index"  # versions/<timestamp>/ + CURRENT pointer, hot-reloaded by the retriever
+INDEX_TYPE = "flat"
+INDEX_METRIC = "cosine"
+CHUNK_TOKENS = None  # e.g. 254 to chunk by embedding-model tokens instead of characters
+SHARD_DIR = "shards"
+SHARDS = None  # e.g. ["arista/support", "arista/products", "arista/news", "arista/advisories"] for one index per subtree
 DRIVE_BACKUP_DIR = "/content/drive/MyDrive" if os.path.exists("/content/drive") else "/backup_data"
+LOG_LEVEL = os.environ.get("RAG_LOG_LEVEL", "INFO")  # DEBUG shows every pipeline step and span timing
+ANSWER_CACHE_DIR = "answer_cache"  # None keeps cached answers in memory only
+ANSWER_CACHE_THRESHOLD = 0.95  # cosine similarity of query embeddings for reusing an answer
+ADAPTIVE_RETRIEVAL = False  # opt-in: skip paraphrasing when the raw query's search is convincing (thresholds: models.rag.FAST_PATH_*)
+REQUEST_BUDGET_MS = 45000  # per-query latency budget; stages degrade (models.deadline.DEGRADATIONS) to meet it, None disables
+CONCURRENT_USERS = 16  # queries Gradio runs at once; model calls are further bounded per model (models.async_rag.MODEL_CONCURRENCY)
 
 MODEL_CHOICES = ["tinyllama", "mistral"] 
 model_cache = {}
 pipeline_cache = {}
+shard_cache = {}
 
 # === SETUP ===
 
 def initialize_vector_store():
-    if not os.path.exists(INDEX_PATH) or not os.path.exists(METADATA_PATH):
-        print("[INFO] Building FAISS index...")
-        build_index(
+    if SHARDS:
+        print("[INFO] Checking index shards for document changes...")
+        shard_cache.update(update_shards(
             main_data_folder=DATA_DIR,
-            index_path=INDEX_PATH,
-            metadata_path=METADATA_PATH,
-            drive_backup_dir=DRIVE_BACKUP_DIR
-        )
+            shard_dir=SHARD_DIR,
+            drive_backup_dir=DRIVE_BACKUP_DIR,
+            subtrees=SHARDS,
+            index_type=INDEX_TYPE,
+            metric=INDEX_METRIC,
+            chunk_tokens=CHUNK_TOKENS
+        ))
     else:
-        print("[INFO] FAISS index and metadata found.")
+        print("[INFO] Checking for document changes...")
+        publish_index(
+            main_data_folder=DATA_DIR,
+            index_root=INDEX_ROOT,
+            drive_backup_dir=DRIVE_BACKUP_DIR,
+            index_type=INDEX_TYPE,
+            metric=INDEX_METRIC,
+            chunk_tokens=CHUNK_TOKENS
+        )
 
 def build_prompt_template():
     return PromptTemplate(
@@ -55,14 +82,24 @@ def build_prompt_template():
     )
 
 def preload_models():
+    # One retriever (index, metadata, BM25) and answer cache (scoped per model) shared by every model's pipeline
+    retriever = FAISSRetriever(shards=shard_cache or None, index_root=INDEX_ROOT)
+    answer_cache = AnswerCache(threshold=ANSWER_CACHE_THRESHOLD, cache_dir=ANSWER_CACHE_DIR)
     for name in MODEL_CHOICES:
         try:
             llm = get_llm(name)
             prompt = build_prompt_template()
             qa_chain = LLMChain(llm=llm, prompt=prompt)
-            rag = RAGPipeline(qa_chain=qa_chain, llm=llm)
+            rag = RAGPipeline(
+                qa_chain=qa_chain,
+                llm=llm,
+                retriever=retriever,
+                answer_cache=answer_cache,
+                model_name=name,
+                adaptive=ADAPTIVE_RETRIEVAL
+            )
             model_cache[name] = llm
-            pipeline_cache[name] = {"rag": rag, "qa_chain": qa_chain}
+            pipeline_cache[name] = {"rag": rag, "async_rag": AsyncRAGPipeline(rag), "qa_chain": qa_chain}
             print(f"[INFO] Loaded model: {name}")
         except Exception as e:
             print(f"[ERROR] Could not load {name}: {e}")
@@ -102,10 +139,20 @@ def launch_ui():
         generate_btn = gr.Button("📄 Generate Word Document")
         download_file = gr.File(label="⬇️ Download Document")
 
+        metrics_btn = gr.Button("⏱️ Export Latency Metrics")
+        metrics_files = gr.File(label="⬇️ Metrics (JSON / Prometheus)", file_count="multiple")
+
         # === FUNCTION WIRING ===
 
+        # An async generator (not a lambda) so Gradio streams the partial answers from its event loop
+        async def submit_query(q, s, sm, m, request: gr.Request):
+            async for update in handle_query(q, s, sm, m, pipeline_cache, session_id=request.session_hash, budget_ms=REQUEST_BUDGET_MS):
+                yield update
+
+        # "multiple" lets a resubmission through while the previous query runs, so handle_query can cancel it
         submit_btn.click(
-            fn=lambda q, s, sm, m: handle_query(q, s, sm, m, pipeline_cache),
+            fn=submit_query,
+            trigger_mode="multiple",
             inputs=[user_query, state, summarize_flag, model_selection],
             outputs=[
                 output_display,
@@ -127,16 +174,18 @@ def launch_ui():
         )
 
         generate_btn.click(fn=generate_document, outputs=download_file)
+        metrics_btn.click(fn=export_metrics, outputs=metrics_files)
         submit_feedback_btn.click(fn=handle_feedback, inputs=[feedback_input, state], outputs=[feedback_ack])
 
         upvote_btn.click(fn=lambda st: handle_vote("up", st), inputs=[state], outputs=[vote_ack])
         downvote_btn.click(fn=lambda st: handle_vote("down", st), inputs=[state], outputs=[vote_ack])
 
-    demo.queue().launch(debug=True, share=True)
+    demo.queue(default_concurrency_limit=CONCURRENT_USERS).launch(debug=True, share=True)
 
 # === MAIN ===
 
 def main():
+    logging.basicConfig(level=LOG_LEVEL, format="[%(levelname)s] %(name)s: %(message)s")
     print("[INFO] Starting RAG Assistant...")
     initialize_vector_store()
     preload_models()
@@ -0,0 +1,92 @@
+# app/batch_cli.py
+
+import os
+import csv
+import time
+import argparse
+from langchain.chains import LLMChain
+
+from app.app import INDEX_ROOT, SHARD_DIR, SHARDS, MODEL_CHOICES, build_prompt_template
+from app.helper import EXPORTS_DIR, write_document
+from app.local_llm_reader import get_llm
+from models.rag import RAGPipeline, BATCH_QUESTIONS
+from vectorstore.index import shard_root
+from vectorstore.retriever import FAISSRetriever
+
+OUT_CSV = os.path.join(EXPORTS_DIR, "rfp_answers.csv")
+OUT_DOCX = os.path.join(EXPORTS_DIR, "rfp_answers.docx")
+
+
+def read_questions(path: str, column: str = None) -> list[str]:
+    """Non-empty cells of `column` (default: "question" if present, else the first column)."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        if column is None:
+            column = "question" if "question" in reader.fieldnames else reader.fieldnames[0]
+        return [row[column].strip() for row in reader if (row.get(column) or "").strip()]
+
+
+def write_answers_csv(items, path: str):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["question", "answer", "category", "confidence", "sources"])
+        for item in items:
+            sources = "; ".join(doc.get('source', 'Unknown Source') for doc in item['docs'])
+            writer.writerow([item['query'], item['answer'], item['category'], item['confidence'], sources])
+
+
+def build_pipeline(model_name: str) -> RAGPipeline:
+    shards = {subtree: shard_root(SHARD_DIR, subtree) for subtree in SHARDS} if SHARDS else None
+    retriever = FAISSRetriever(shards=shards, index_root=INDEX_ROOT)
+    llm = get_llm(model_name)
+    qa_chain = LLMChain(llm=llm, prompt=build_prompt_template())
+    return RAGPipeline(qa_chain=qa_chain, llm=llm, retriever=retriever, model_name=model_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a CSV of questions (e.g. an RFP) headlessly with RAGPipeline.run_batch.")
+    parser.add_argument("questions", help="CSV file with one question per row")
+    parser.add_argument("--column", default=None, help='question column (default: "question" or the first column)')
+    parser.add_argument("--model", default="tinyllama", choices=MODEL_CHOICES)
+    parser.add_argument("--summarize", action="store_true", help="summarize retrieved documents into the context")
+    parser.add_argument("--filter-by-category", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=BATCH_QUESTIONS, help="questions per run_batch call")
+    parser.add_argument("--out-csv", default=OUT_CSV)
+    parser.add_argument("--out-docx", default=OUT_DOCX)
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions, args.column)
+    print(f"[INFO] Answering {len(questions)} questions from {args.questions} with {args.model}")
+    rag = build_pipeline(args.model)
+
+    items = []
+    start = time.perf_counter()
+    for offset in range(0, len(questions), args.batch_size):
+        batch = questions[offset:offset + args.batch_size]
+        results = rag.run_batch(batch, summarize_docs=args.summarize, filter_by_category=args.filter_by_category)
+        for question, result in zip(batch, results):
+            items.append({
+                'query': question,
+                'category': result['category'],
+                'context': result['context'],
+                'answer': result['answer'],
+                'docs': result['sources'],
+                'confidence': result['confidence_score']
+            })
+        elapsed = time.perf_counter() - start
+        print(f"[INFO] {len(items)}/{len(questions)} answered, {len(items) / elapsed * 60:.1f} questions/min")
+
+    elapsed = time.perf_counter() - start
+    os.makedirs(os.path.dirname(args.out_csv) or ".", exist_ok=True)
+    os.makedirs(os.path.dirname(args.out_docx) or ".", exist_ok=True)
+    write_answers_csv(items, args.out_csv)
+    write_document(items, args.out_docx)
+    rate = len(items) / elapsed * 60 if elapsed else 0.0
+    print(f"[INFO] {len(items)} questions in {elapsed:.1f}s ({rate:.1f} questions/min)")
+    print(f"[INFO] Wrote {args.out_csv} and {args.out_docx}")
+
+
+if __name__ == "__main__":
+    main()
+
+# python -m app.batch_cli rfp_questions.csv --model mistral --batch-size 16 --out-csv exports/rfp_answers.csv
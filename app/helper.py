@@ -3,17 +3,25 @@
 import os
 import shutil
 import csv
+import logging
 import datetime
+import threading
 from docx import Document
 from models.rag import RAGPipeline
+from models.tracing import default_tracer
+from models.deadline import RequestCancelled
 import gradio as gr
 
+logger = logging.getLogger(__name__)
+
 # === Directory Setup ===
 FEEDBACK_DIR = "feedback"
 EXPORTS_DIR = "exports"
 FEEDBACK_FILE = os.path.join(FEEDBACK_DIR, "rag_feedback.csv")
 VOTE_FILE = os.path.join(FEEDBACK_DIR, "rag_votes.csv")
 EXPORT_PATH = os.path.join(EXPORTS_DIR, "rag_summary.docx")
+METRICS_JSON_PATH = os.path.join(EXPORTS_DIR, "rag_metrics.json")
+METRICS_PROM_PATH = os.path.join(EXPORTS_DIR, "rag_metrics.prom")
 
 os.makedirs(FEEDBACK_DIR, exist_ok=True)
 os.makedirs(EXPORTS_DIR, exist_ok=True)
@@ -21,13 +29,42 @@ os.makedirs(EXPORTS_DIR, exist_ok=True)
 # === Session state for export ===
 session_answers = []
 
+# Cancel event of each browser session's in-flight query; a resubmission cancels the previous one
+active_queries = {}
+
 
-def handle_query(query, state, summarize_docs, model_selection, pipeline_cache):
-    rag = pipeline_cache[model_selection]["rag"]
+async def handle_query(query, state, summarize_docs, model_selection, pipeline_cache, session_id=None, budget_ms=None):
+    """
+    Streaming Gradio handler: shows the answer as it is generated, then the sources and confidence.
+    Runs on Gradio's event loop, so concurrent users only wait for each other at the model pools.
+    A new query from the same session cancels the previous one; so does the client disconnecting
+    (Gradio cancels the handler, which closes the stream).
+    """
+    rag = pipeline_cache[model_selection]["async_rag"]
     qa_chain = pipeline_cache[model_selection]["qa_chain"]
 
-    print(f"[DEBUG] Query received: {query}")
-    result = rag.run(query, summarize_docs=summarize_docs)
+    cancel = threading.Event()
+    if session_id is not None:
+        previous = active_queries.get(session_id)
+        if previous is not None:
+            previous.set()
+        active_queries[session_id] = cancel
+
+    logger.debug("Query received: %s", query)
+    partial_answer = ""
+    try:
+        async for kind, value in rag.run_stream(query, summarize_docs=summarize_docs, budget_ms=budget_ms, cancel=cancel):
+            if kind == "result":
+                result = value
+                break
+            partial_answer += value
+            yield (f"### ⏳ Generating Answer...\n\n{partial_answer}▌", state) + (gr.update(),) * 7
+    except RequestCancelled:
+        logger.debug("Query superseded by a newer one from the same session: %s", query)
+        return
+    finally:
+        if active_queries.get(session_id) is cancel:
+            del active_queries[session_id]
 
     answer = result['answer']
     context = result['context']
@@ -57,10 +94,15 @@ def handle_query(query, state, summarize_docs, model_selection, pipeline_cache):
         'confidence': confidence
     })
 
+    cache_note = f"**Cached answer** (similar question: _{result['cached_query']}_)  \n" if result.get('cached_query') else ""
+    if result.get('degradations'):
+        cache_note += f"**Shortened to meet the time budget:** {', '.join(result['degradations'])}  \n"
+
     display = f"""### ✅ Answer Generated
 
 **Category:** {category}  
-**Confidence Score:** {confidence}%
+**Confidence Score:** {confidence}%  
+{cache_note}
 
 **Answer:**  
 {answer}
@@ -76,7 +118,7 @@ def handle_query(query, state, summarize_docs, model_selection, pipeline_cache):
     #     chunk_display
     # )
 
-    return (
+    yield (
         display,
         state,
         gr.update(visible=True),              # upvote_btn
@@ -92,6 +134,7 @@ def handle_query(query, state, summarize_docs, model_selection, pipeline_cache):
 def apply_suggestion(suggestion, state, pipeline_cache):
     model = state.get("model_used", "tinyllama")
     qa_chain = pipeline_cache[model]["qa_chain"]
+    async_rag = pipeline_cache[model]["async_rag"]
 
     if not suggestion.strip():
         final_answer = state.get('answer', 'No answer found.')
@@ -101,7 +144,8 @@ def apply_suggestion(suggestion, state, pipeline_cache):
             "context": f"{state['context']}\n\nPrevious Answer: {state['answer']}\n\nSuggestion: {suggestion}",
             "category": state['category']
         }
-        new_answer = qa_chain.invoke(improved_prompt)
+        # Through the model's pool: llama.cpp must not run two generations on one model at once
+        new_answer = async_rag.executors.executor("llm", async_rag.pipeline.llm).submit(qa_chain.invoke, improved_prompt).result()
         final_answer = new_answer['text'] if isinstance(new_answer, dict) else new_answer
         state['answer'] = final_answer
 
@@ -120,11 +164,12 @@ def apply_suggestion(suggestion, state, pipeline_cache):
     return display, state
 
 
-def generate_document():
+def write_document(items, path):
+    """Write QA items (query, category, answer, confidence, docs...) as the RAG QA Summary .docx."""
     doc = Document()
     doc.add_heading("RAG QA Summary", level=0)
 
-    for i, item in enumerate(session_answers, 1):
+    for i, item in enumerate(items, 1):
         doc.add_heading(f"Q{i}", level=1)
         table = doc.add_table(rows=5, cols=1)
         table.style = 'Table Grid'
@@ -141,7 +186,12 @@ def generate_document():
             doc.add_paragraph(f"{j}. {source}")
         doc.add_paragraph("=" * 50)
 
-    doc.save(EXPORT_PATH)
+    doc.save(path)
+    return path
+
+
+def generate_document():
+    write_document(session_answers, EXPORT_PATH)
 
     try:
         shutil.copy(EXPORT_PATH, "/content/drive/MyDrive/rag_summary.docx")
@@ -152,6 +202,13 @@ def generate_document():
     return EXPORT_PATH
 
 
+def export_metrics():
+    """Write per-stage latency histograms and counters (JSON + Prometheus text) and return both paths."""
+    default_tracer.export_json(METRICS_JSON_PATH)
+    default_tracer.export_prometheus(METRICS_PROM_PATH)
+    return [METRICS_JSON_PATH, METRICS_PROM_PATH]
+
+
 def handle_feedback(feedback_text, state):
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     feedback_data = {
@@ -0,0 +1,202 @@
+# models/answer_cache.py
+
+import os
+import json
+import time
+import threading
+import faiss
+import numpy as np
+from collections import OrderedDict
+
+# Cosine similarity between query embeddings at which a cached answer is reused
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_SIZE = 1024
+ANSWER_CACHE_TTL = 24 * 3600  # seconds
+ANSWER_CACHE_FILE = "answers.jsonl"
+
+
+class _Entry:
+    def __init__(self, scope: str, query: str, vector: np.ndarray, result: dict, created: float):
+        self.scope = scope
+        self.query = query
+        self.vector = vector
+        self.result = result
+        self.created = created
+
+
+class AnswerCache:
+    """
+    Semantic cache of RAGPipeline results.
+
+    Entries live in scopes (model name, summarize_docs, filter_by_category and
+    index version, see answer_scope), each with a small FAISS inner-product
+    index over the normalized embeddings of its cached queries. A query whose
+    cosine similarity to a cached query of the same scope reaches `threshold`
+    gets that query's result back without running the pipeline. Publishing a
+    new index version changes the scope, so stale answers are never served.
+
+    At most `max_entries` results are kept, evicting the least recently used,
+    and results older than `ttl` seconds are dropped. With `cache_dir`, every
+    result is also appended to a JSON-lines file there and the newest entries
+    are reloaded on restart.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        cache_dir: str = None
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = None
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()  # entry ID -> _Entry, least recently used first
+        self._indexes = {}             # scope -> faiss.IndexIDMap2 over the scope's query vectors
+        self._next_id = 0
+        self._lines = 0
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.path = os.path.join(cache_dir, ANSWER_CACHE_FILE)
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, scope: str, query_vec: np.ndarray):
+        """Cached result of the most similar query in `scope`, or None on a miss."""
+        query_vec = _normalized(query_vec)
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is not None and index.ntotal:
+                D, I = index.search(query_vec, 1)
+                entry_id, similarity = int(I[0, 0]), float(D[0, 0])
+                entry = self._entries.get(entry_id)
+                if entry is not None and similarity >= self.threshold:
+                    if time.time() - entry.created <= self.ttl:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        return dict(entry.result, cached_query=entry.query, cache_similarity=round(similarity, 4))
+                    self._remove(entry_id)
+            self.misses += 1
+            return None
+
+    def put(self, scope: str, query: str, query_vec: np.ndarray, result: dict):
+        entry = _Entry(scope, query, _normalized(query_vec)[0], result, time.time())
+        with self._lock:
+            self._add(entry)
+            if self.path:
+                self._append(entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+            if self.path:
+                open(self.path, "w").close()
+                self._lines = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    # === Internals (called with the lock held) ===
+
+    def _add(self, entry: _Entry):
+        entry_id = self._next_id
+        self._next_id += 1
+        index = self._indexes.get(entry.scope)
+        if index is None:
+            index = self._indexes[entry.scope] = faiss.IndexIDMap2(faiss.IndexFlatIP(len(entry.vector)))
+        index.add_with_ids(entry.vector[None, :], np.array([entry_id], dtype="int64"))
+        self._entries[entry_id] = entry
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        index = self._indexes[entry.scope]
+        index.remove_ids(np.array([entry_id], dtype="int64"))
+        if index.ntotal == 0:
+            del self._indexes[entry.scope]
+
+    def _append(self, entry: _Entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(_dump(entry) + "\n")
+        self._lines += 1
+        # Rewrite the file once evicted entries make up most of it
+        if self._lines > 2 * self.max_entries:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for live in self._entries.values():
+                    f.write(_dump(live) + "\n")
+            os.replace(tmp_path, self.path)
+            self._lines = len(self._entries)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        now = time.time()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line of an interrupted write
+                if now - record["created"] > self.ttl:
+                    continue
+                vector = np.array(record["vector"], dtype="float32")
+                self._add(_Entry(record["scope"], record["query"], vector, record["result"], record["created"]))
+        print(f"[INFO] Loaded {len(self._entries)} cached answers from {self.path}")
+
+
+def answer_scope(model_name: str, summarize_docs: bool, filter_by_category: bool, index_versions: dict, adaptive: bool = False) -> str:
+    """Cache scope: answers are only shared between requests that would produce the same result."""
+    scope = [model_name, bool(summarize_docs), bool(filter_by_category), sorted(index_versions.items())]
+    if adaptive:
+        scope.append("adaptive")
+    return json.dumps(scope)
+
+
+def _normalized(vector) -> np.ndarray:
+    vector = np.array(vector, dtype="float32").reshape(1, -1)
+    faiss.normalize_L2(vector)
+    return vector
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dump(entry: _Entry) -> str:
+    return json.dumps({
+        "scope": entry.scope,
+        "query": entry.query,
+        "created": entry.created,
+        "vector": entry.vector.tolist(),
+        "result": entry.result
+    }, default=_json_default)
+
+
+# from models.answer_cache import AnswerCache, answer_scope
+
+# cache = AnswerCache(threshold=0.95, cache_dir="answer_cache")
+# scope = answer_scope("mistral", summarize_docs=True, filter_by_category=False, index_versions={"default": "20240601T120000000000"})
+# cache.put(scope, "Describe your SLA", query_vec, result)
+# print(cache.get(scope, query_vec)["answer"], cache.stats())
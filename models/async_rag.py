@@ -0,0 +1,173 @@
+# models/async_rag.py
+
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from models.rag import StreamClosed, _Call, _Start, _timed
+from models.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+# Calls in flight per model instance. A llama.cpp context generates one sequence at a
+# time; the torch models already spread one forward over every core, so a second call
+# only fills the gaps between forwards (tokenization, beam bookkeeping).
+MODEL_CONCURRENCY = {
+    "paraphraser": 1,
+    "classifier": 2,
+    "summarizer": 1,
+    "embedder": 2,
+    "llm": 1
+}
+
+
+class ModelExecutors:
+    """
+    One bounded thread pool per model instance, sized by the concurrency limit
+    of its kind, so concurrent requests queue per model instead of
+    oversubscribing the cores. Share one instance between the pipelines of a
+    process: the embedder is process-wide, and pipelines that share a model
+    object share its pool.
+    """
+
+    def __init__(self, limits: dict = None):
+        self.limits = dict(MODEL_CONCURRENCY, **(limits or {}))
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def executor(self, kind: str, model=None) -> ThreadPoolExecutor:
+        key = (kind, id(model))
+        with self._lock:
+            executor = self._executors.get(key)
+            if executor is None:
+                executor = self._executors[key] = ThreadPoolExecutor(
+                    max_workers=self.limits[kind],
+                    thread_name_prefix=f"rag-{kind}"
+                )
+            return executor
+
+    async def call(self, kind: str, model, fn, *args):
+        """Await fn(*args) on `model`'s pool, in the caller's context (pinned index version, current trace)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor(kind, model), contextvars.copy_context().run, fn, *args)
+
+    def shutdown(self):
+        with self._lock:
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+            self._executors.clear()
+
+
+# Shared by every async pipeline unless one is given its own
+default_executors = ModelExecutors()
+
+
+class AsyncRAGPipeline:
+    """
+    asyncio front end of a RAGPipeline, for serving many users from one event loop.
+
+    It runs the same steps as RAGPipeline.run (RAGPipeline._pipeline), so
+    results are the same for the same query. Each step's model work (T5
+    paraphraser, DeBERTa classifier, MiniLM embedder together with the
+    searches, reranking and MMR that may embed, DistilBART summarizer,
+    LlamaCpp) runs on `executors`, bounded per model; the event loop only
+    sequences the steps. While one request waits for the LLM, others
+    paraphrase, classify and retrieve, so throughput grows with concurrent
+    users until the cores are busy.
+    """
+
+    def __init__(self, pipeline, executors: ModelExecutors = None):
+        self.pipeline = pipeline
+        self.executors = executors or default_executors
+
+    async def run(self, user_query: str, summarize_docs=False, filter_by_category=False, on_token=None, budget_ms=None, cancel=None):
+        """
+        Answer one query. With `on_token`, the answer is streamed and every piece
+        is passed to on_token(piece) on the LLM's thread (see run_stream for an
+        async iterator instead). `budget_ms` and `cancel` work as in
+        RAGPipeline.run; cancelling the awaiting task also stops generation.
+        """
+        rag = self.pipeline
+        deadline = Deadline(budget_ms, cancel or threading.Event())
+        with rag._request(summarize_docs, filter_by_category, budget_ms) as trace:
+            try:
+                return await self._drive(rag._pipeline(user_query, summarize_docs, filter_by_category, on_token, deadline, trace))
+            except asyncio.CancelledError:
+                deadline.cancel.set()
+                raise
+
+    async def run_stream(self, user_query: str, summarize_docs=False, filter_by_category=False, budget_ms=None, cancel=None):
+        """
+        Async counterpart of RAGPipeline.run_stream(): yields ("token", text)
+        pieces while the LLM generates, then one ("result", dict) with
+        "time_to_first_token_ms". Closing the iterator early stops generation at
+        the next token.
+        """
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        closed = threading.Event()
+        start = time.perf_counter()
+
+        def on_token(piece):
+            if closed.is_set():
+                raise StreamClosed("stream closed by the consumer")
+            loop.call_soon_threadsafe(events.put_nowait, piece)
+
+        task = asyncio.ensure_future(self.run(user_query, summarize_docs, filter_by_category, on_token, budget_ms, cancel))
+        # Queued after every token the request produced, since tokens are posted before it finishes
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        first_token_ms = None
+        try:
+            while True:
+                piece = await events.get()
+                if piece is None:
+                    break
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                    logger.debug("Time to first token: %.0f ms", first_token_ms)
+                yield "token", piece
+            yield "result", dict(task.result(), time_to_first_token_ms=first_token_ms)
+        finally:
+            closed.set()
+            task.cancel()
+
+    async def _drive(self, steps):
+        """Run a RAGPipeline._pipeline on the model executors; started steps still running at the end are cancelled."""
+        rag = self.pipeline
+        started = []
+        value, error = None, None
+        try:
+            while True:
+                try:
+                    step = steps.throw(error) if error is not None else steps.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                value, error = None, None
+                try:
+                    if isinstance(step, _Start):
+                        value = asyncio.ensure_future(self.executors.call(step.kind, rag._model(step.kind), _timed, step.fn, *step.args))
+                        started.append(value)
+                    elif isinstance(step, _Call):
+                        value = await self.executors.call(step.kind, rag._model(step.kind), step.fn, *step.args)
+                    else:
+                        try:
+                            value = await asyncio.wait_for(asyncio.shield(step.handle), step.timeout)
+                        except asyncio.TimeoutError:
+                            raise TimeoutError("step did not finish in time")
+                except BaseException as e:
+                    error = e
+        finally:
+            for task in started:
+                task.cancel()
+            steps.close()
+
+
+# from models.async_rag import AsyncRAGPipeline
+
+# async_rag = AsyncRAGPipeline(rag)
+# result = await async_rag.run("Describe your SLA", summarize_docs=True)
+# async for kind, value in async_rag.run_stream("Describe your SLA"):
+#     print(value if kind == "token" else value["confidence_score"], end="")
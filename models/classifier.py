@@ -1,7 +1,6 @@
 # models/classifier.py
 
 from transformers import pipeline
-from concurrent.futures import ThreadPoolExecutor
 
 # Define candidate categories for classification
 CATEGORIES = ["general", "legal", "finance", "product", "feature", "news", "collaboration"]
@@ -71,9 +70,14 @@ class QueryClassifier:
         result = self.classifier(prompt, candidate_labels=CATEGORIES)
         return result['labels'][0], result['scores'][0]
 
-    def classify_batch(self, queries: list[str]) -> list[tuple[str, float]]:
-        with ThreadPoolExecutor() as executor:
-            return list(executor.map(self.classify, queries))
+    def classify_batch(self, queries: list[str], batch_size: int = 16) -> list[tuple[str, float]]:
+        """Classify many queries in one pipeline call; the (query, label) pairs run `batch_size` per forward."""
+        if not queries:
+            return []
+        results = self.classifier([self.build_prompt(query) for query in queries], candidate_labels=CATEGORIES, batch_size=batch_size)
+        if isinstance(results, dict):
+            results = [results]
+        return [(result['labels'][0], result['scores'][0]) for result in results]
 
 
 # from models.classifier import QueryClassifier
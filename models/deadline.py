@@ -0,0 +1,106 @@
+# models/deadline.py
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# What a request short on time gives up, in this order (see RAGPipeline.run)
+DEGRADATIONS = (
+    "skip_paraphrasing",    # classify and search with the user's query only (also when paraphrases arrive late)
+    "skip_summarization",   # put the selected chunks into the prompt as they are
+    "shrink_max_tokens",    # cap the answer at the tokens the remaining time allows
+    "single_query_search",  # search the user's query alone, reusing its prefetched rows
+    "truncate_answer"       # stop generating when the budget runs out
+)
+
+# Weight of the newest measurement in the moving averages
+ESTIMATE_ALPHA = 0.2
+
+# LlamaCpp's own default, for LLMs that do not expose max_tokens
+DEFAULT_MAX_TOKENS = 256
+
+# A shrunk answer still gets at least this many tokens
+MIN_ANSWER_TOKENS = 32
+
+
+class RequestCancelled(Exception):
+    """Raised inside a request once its cancel event is set (client gone or query resubmitted)."""
+
+
+class StageEstimates:
+    """
+    Exponential moving averages of stage latencies (ms), to judge what still
+    fits in a request's budget. "prompt" is the time to the first generated
+    token, "token" the time per token after it. A stage never measured counts
+    as free, so the first requests run in full and measure it; a skipped
+    stage's estimate is relaxed, so it gets tried (and measured) again.
+    """
+
+    def __init__(self, alpha: float = ESTIMATE_ALPHA):
+        self.ms = {}
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def __getitem__(self, stage: str) -> float:
+        return self.ms.get(stage, 0.0)
+
+    def observe(self, stage: str, ms: float):
+        with self._lock:
+            self.ms[stage] = (1 - self.alpha) * self.ms.get(stage, ms) + self.alpha * ms
+
+    def relax(self, stage: str):
+        with self._lock:
+            if stage in self.ms:
+                self.ms[stage] *= 1 - self.alpha
+
+    def generation_ms(self, tokens: int) -> float:
+        return self["prompt"] + tokens * self["token"]
+
+
+class Deadline:
+    """
+    Latency budget of one request and the degradations it forced. Without a
+    budget every stage fits; `cancel` (a threading.Event) aborts the request at
+    the next check, generation included.
+    """
+
+    def __init__(self, budget_ms: float = None, cancel: threading.Event = None):
+        self.budget_ms = budget_ms
+        self.expires = time.perf_counter() + budget_ms / 1000 if budget_ms is not None else None
+        self.cancel = cancel
+        self.degradations = []
+
+    @property
+    def active(self) -> bool:
+        """Whether generation has to be watched token by token."""
+        return self.expires is not None or self.cancel is not None
+
+    def remaining_ms(self) -> float:
+        if self.expires is None:
+            return float("inf")
+        return (self.expires - time.perf_counter()) * 1000
+
+    def fits(self, ms: float) -> bool:
+        return self.remaining_ms() >= ms
+
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def degrade(self, name: str):
+        if name not in self.degradations:
+            self.degradations.append(name)
+            logger.debug("Degraded: %s (%.0f ms left of %s ms)", name, self.remaining_ms(), self.budget_ms)
+
+    def check(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise RequestCancelled("request cancelled")
+
+
+# from models.deadline import Deadline
+
+# deadline = Deadline(budget_ms=30000, cancel=threading.Event())
+# if not deadline.fits(estimates["summarize"] + estimates.generation_ms(256)):
+#     deadline.degrade("skip_summarization")
+# print(deadline.remaining_ms(), deadline.degradations)
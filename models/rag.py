@@ -1,53 +1,623 @@
 # models/rag.py
 
+import time
+import queue
+import logging
+import threading
+import contextvars
 import numpy as np
 from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 from models.similar_query import QueryParaphraser
 from models.classifier import QueryClassifier
 from models.summarizer import Summarizer
 from vectorstore.retriever import FAISSRetriever
-from vectorstore.embedding import get_cached_embedding
+from vectorstore.filters import MetadataFilter
+from vectorstore.embedding import get_cached_embedding, embed_queries, query_cache_hits
+from models.tracing import default_tracer
+from models.answer_cache import answer_scope
+from models.deadline import Deadline, StageEstimates, RequestCancelled, DEFAULT_MAX_TOKENS, MIN_ANSWER_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Questions per run_batch step: every model call covers this many questions at once
+BATCH_QUESTIONS = 16
+
+# Adaptive mode keeps the user's query's own search (skipping paraphrasing and classification)
+# when its best hit reaches this cosine similarity and leads the runner-up by this margin
+FAST_PATH_MIN_SCORE = 0.75
+FAST_PATH_MIN_MARGIN = 0.02
+
+# Threads for the stages that overlap (paraphrase, classify, embed paraphrases, prefetch retrieval), two requests' worth
+STAGE_WORKERS = 8
+
+
+class StreamClosed(RequestCancelled):
+    """Raised inside a streaming run once its consumer has stopped reading."""
+
+
+class _Step:
+    """
+    Model work yielded by RAGPipeline._pipeline for its front end to run:
+    fn(*args) on the pool of `kind`'s model (a key of
+    models.async_rag.MODEL_CONCURRENCY; "embedder" for anything that may embed).
+    """
+
+    def __init__(self, kind: str, fn, *args):
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+
+
+class _Call(_Step):
+    """Run the step and resume with its result."""
+
+
+class _Start(_Step):
+    """Start the step without waiting; resume with a handle for _Wait."""
+
+
+class _Wait:
+    """Resume with the (result, ms) of a started step, or raise TimeoutError after `timeout` seconds."""
+
+    def __init__(self, handle, timeout: float = None):
+        self.handle = handle
+        self.timeout = timeout
 
 
 class RAGPipeline:
-    def __init__(self, qa_chain, llm, retriever=None, summarizer=None):
+    def __init__(
+        self,
+        qa_chain,
+        llm,
+        retriever=None,
+        summarizer=None,
+        tracer=None,
+        answer_cache=None,
+        model_name=None,
+        adaptive=False,
+        fast_path_min_score=FAST_PATH_MIN_SCORE,
+        fast_path_min_margin=FAST_PATH_MIN_MARGIN
+    ):
+        """
+        With `adaptive`, run() first searches with the user's query alone and
+        only paraphrases it (and searches with the paraphrases) when the best
+        hit's cosine similarity is below `fast_path_min_score` or leads the next
+        hit by less than `fast_path_min_margin`; the query is classified either
+        way. The result's "retrieval_path" says which ran.
+        """
         self.qa_chain = qa_chain
         self.llm = llm
+        self.model_name = model_name or getattr(llm, "model_path", type(llm).__name__)
+        self.answer_cache = answer_cache
         self.retriever = retriever or FAISSRetriever()
         self.summarizer = summarizer or Summarizer()
         self.paraphraser = QueryParaphraser()
         self.classifier = QueryClassifier()
+        self.tracer = tracer if tracer is not None else default_tracer
+        self.stage_estimates = StageEstimates()
+        self.adaptive = adaptive
+        self.fast_path_min_score = fast_path_min_score
+        self.fast_path_min_margin = fast_path_min_margin
+        self._executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="rag-stage")
+
+    def run(self, user_query: str, summarize_docs=False, filter_by_category=False, on_token=None, budget_ms=None, cancel=None):
+        """
+        Answer one query. With `on_token`, the answer is generated through
+        llm.stream() and every piece is passed to on_token(piece) as soon as the
+        model produces it (a cached answer arrives as a single piece).
+
+        `budget_ms` is the request's latency budget. Judged against moving
+        averages of each stage's latency, a request running short skips
+        paraphrasing, then summarization, then caps max_tokens to what the time
+        left allows, and as a last resort searches with the user's query alone;
+        generation stops when the budget is spent. The result's "degradations"
+        lists what fired (see models.deadline.DEGRADATIONS). Degraded answers
+        are not cached.
+
+        Setting `cancel` (a threading.Event) from another thread stops the
+        request at the next stage or generated token with RequestCancelled.
+        """
+        deadline = Deadline(budget_ms, cancel)
+        with self._request(summarize_docs, filter_by_category, budget_ms) as trace:
+            return self._drive(self._pipeline(user_query, summarize_docs, filter_by_category, on_token, deadline, trace))
+
+    @contextmanager
+    def _request(self, summarize_docs, filter_by_category, budget_ms):
+        """One index version for the whole request, even if a new one is hot-reloaded meanwhile, and its trace."""
+        with self.retriever.pinned(), self.tracer.trace("rag_run", summarize_docs=summarize_docs, filter_by_category=filter_by_category) as trace:
+            # On the trace only: integer span attributes are summed into the stage counters
+            if trace is not None and budget_ms is not None:
+                trace.attributes["budget_ms"] = budget_ms
+            yield trace
+
+    def _drive(self, steps):
+        """Run a _pipeline in this thread: _Call steps inline, _Start steps on the stage pool."""
+        value, error = None, None
+        try:
+            while True:
+                try:
+                    step = steps.throw(error) if error is not None else steps.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                value, error = None, None
+                try:
+                    if isinstance(step, _Start):
+                        value = self._submit(step.fn, *step.args)
+                    elif isinstance(step, _Call):
+                        value = step.fn(*step.args)
+                    else:
+                        try:
+                            value = step.handle.result(timeout=step.timeout)
+                        except FutureTimeoutError:
+                            raise TimeoutError("step did not finish in time")
+                except BaseException as e:
+                    error = e
+        finally:
+            steps.close()
+
+    def _model(self, kind):
+        """The model instance a step kind runs on (None for the process-wide embedder)."""
+        return {"paraphraser": self.paraphraser, "classifier": self.classifier, "summarizer": self.summarizer, "llm": self.llm}.get(kind)
+
+    def _pipeline(self, user_query, summarize_docs, filter_by_category, on_token, deadline, trace):
+        """
+        The steps of one request, shared by run() and AsyncRAGPipeline.run():
+        a generator that yields its model work as _Call/_Start/_Wait steps for
+        the front end to run (see _drive) and returns the result dict.
+        """
+        if self.answer_cache is None:
+            result = yield from self._answer(user_query, summarize_docs, filter_by_category, on_token, deadline)
+            return self._finish(result, deadline, trace)
+
+        # Repeated (or near-identical) questions against the same model and index version skip the pipeline
+        scope, query_vec, cached = yield _Call("embedder", self._lookup_answer, user_query, summarize_docs, filter_by_category)
+        if cached is not None:
+            logger.debug("Answer cache hit for '%s' (similarity %.3f to '%s')", user_query, cached["cache_similarity"], cached["cached_query"])
+            if on_token is not None:
+                on_token(cached["answer"])
+            return dict(cached, degradations=[])
+
+        result = yield from self._answer(user_query, summarize_docs, filter_by_category, on_token, deadline)
+        result = self._finish(result, deadline, trace)
+        if not result["degradations"]:
+            self.answer_cache.put(scope, user_query, query_vec, result)
+        return result
+
+    def _lookup_answer(self, user_query, summarize_docs, filter_by_category):
+        with self.tracer.span("answer_cache") as span:
+            scope = answer_scope(self.model_name, summarize_docs, filter_by_category, self.retriever.versions, self.adaptive)
+            query_vec = np.array(get_cached_embedding(user_query), dtype="float32")
+            cached = self.answer_cache.get(scope, query_vec)
+            span.set(cache_hit=cached is not None)
+        return scope, query_vec, cached
+
+    @staticmethod
+    def _finish(result, deadline, trace=None):
+        if trace is not None and deadline.degradations:
+            trace.attributes["degradations"] = list(deadline.degradations)
+        return dict(result, degradations=list(deadline.degradations))
+
+    def run_stream(self, user_query: str, summarize_docs=False, filter_by_category=False, budget_ms=None, cancel=None):
+        """
+        Streaming variant of run(): yields ("token", text) pieces while the LLM
+        generates, then a single ("result", dict) with the same result as run()
+        plus "time_to_first_token_ms".
+
+        The request runs on its own thread so its pinned index version and trace
+        stay in one context however the caller iterates. Closing the generator
+        early stops generation at the next token.
+        """
+        events = queue.Queue()
+        closed = threading.Event()
+        start = time.perf_counter()
+
+        def on_token(piece):
+            if closed.is_set():
+                raise StreamClosed("stream closed by the consumer")
+            events.put(("token", piece))
+
+        def produce():
+            try:
+                events.put(("result", self.run(user_query, summarize_docs, filter_by_category, on_token, budget_ms, cancel)))
+            except BaseException as e:
+                events.put(("error", e))
+
+        threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="rag-stream", daemon=True).start()
+        first_token_ms = None
+        try:
+            while True:
+                kind, value = events.get()
+                if kind == "error":
+                    raise value
+                if kind == "token" and first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                    logger.debug("Time to first token: %.0f ms", first_token_ms)
+                if kind == "result":
+                    yield kind, dict(value, time_to_first_token_ms=first_token_ms)
+                    return
+                yield kind, value
+        finally:
+            closed.set()
+
+    def run_batch(self, user_queries: list[str], summarize_docs=False, filter_by_category=False) -> list[dict]:
+        """
+        Answer many queries with each stage batched across all of them: one
+        paraphrase generate call, one classifier call over every query and
+        paraphrase, one embedding call and one multi-query FAISS search per shard
+        for all retrieval queries, and one embedding call for the answers and
+        queries used in the confidence score. Queries found in the answer cache
+        skip the pipeline.
+
+        Generation goes through qa_chain.apply(). LangChain's LlamaCpp runs
+        those prompts one after another (llama.cpp's Python API decodes a single
+        sequence at a time), and n_batch already batches each prompt's evaluation.
+
+        Returns one result dict per query, in order, as run() would return it.
+        """
+        tracer = self.tracer
+        with self.retriever.pinned(), tracer.trace("rag_run_batch", questions=len(user_queries), summarize_docs=summarize_docs):
+            results = [None] * len(user_queries)
+            if self.answer_cache is not None:
+                with tracer.span("answer_cache", queries=len(user_queries)) as span:
+                    scope = answer_scope(self.model_name, summarize_docs, filter_by_category, self.retriever.versions)
+                    cache_vecs = embed_queries(list(user_queries))
+                    for i, query_vec in enumerate(cache_vecs):
+                        results[i] = self.answer_cache.get(scope, query_vec)
+                    span.set(cache_hits=sum(result is not None for result in results))
+            pending = [i for i, result in enumerate(results) if result is None]
+            queries = [user_queries[i] for i in pending]
+            if not queries:
+                return results
+
+            # Step 1: Query Expansion
+            with tracer.span("paraphrase", queries=len(queries)):
+                expansions = self.paraphraser.generate_batch(queries)
+            all_queries = [[query] + paraphrases for query, paraphrases in zip(queries, expansions)]
+
+            # Step 2: Classification
+            with tracer.span("classify", queries=sum(len(group) for group in all_queries)):
+                flat_pairs = self.classifier.classify_batch([q for group in all_queries for q in group])
+            votes, offset = [], 0
+            for group in all_queries:
+                votes.append(_vote(group, flat_pairs[offset:offset + len(group)]))
+                offset += len(group)
+
+            # Step 3: Retrieval, category-filtered per predicted label when asked, unfiltered otherwise or when empty
+            with tracer.span("retrieval", queries=sum(len(filtered) for _, _, filtered in votes)) as span:
+                retrieved = [[] for _ in queries]
+                if filter_by_category:
+                    for label in sorted({label for label, _, _ in votes} - {"general"}):
+                        rows = [i for i, (vote_label, _, _) in enumerate(votes) if vote_label == label]
+                        hits = self.retriever.hybrid_search_batch([votes[i][2] for i in rows], filters=MetadataFilter(category=label))
+                        for i, row_hits in zip(rows, hits):
+                            retrieved[i] = row_hits
+                rows = [i for i, hits in enumerate(retrieved) if not hits]
+                for i, hits in zip(rows, self.retriever.hybrid_search_batch([votes[i][2] for i in rows])):
+                    retrieved[i] = hits
+                span.set(candidates=sum(len(hits) for hits in retrieved))
+
+            # Steps 4-6 per query (vector lookups only), then Step 7 for all prompts
+            contexts = [self._build_context(query, hits, summarize_docs) for query, hits in zip(queries, retrieved)]
+            with tracer.span("generate", prompts=len(queries)):
+                inputs = [
+                    {"query": query, "context": context, "category": label}
+                    for query, (_, _, context, _), (label, _, _) in zip(queries, contexts, votes)
+                ]
+                answers = [output['text'] for output in self.qa_chain.apply(inputs)]
+
+            # Step 8: Confidence Score Calculation
+            with tracer.span("confidence", queries=len(queries)):
+                vectors = embed_queries(answers + queries)
+                answer_vecs, query_vecs = vectors[:len(queries)], vectors[len(queries):]
+                for i, answer, answer_vec, query_vec, (unique_docs, context_docs, context, avg_similarity), (label, conf, _) in zip(
+                    pending, answers, answer_vecs, query_vecs, contexts, votes
+                ):
+                    results[i] = self._build_result(
+                        answer, answer_vec, query_vec, label, conf,
+                        avg_similarity, unique_docs, context_docs, context
+                    )
+                    results[i].update(degradations=[], retrieval_path="expanded")
+                    if self.answer_cache is not None:
+                        self.answer_cache.put(scope, user_queries[i], cache_vecs[i], results[i])
+            return results
 
-    def run(self, user_query: str, summarize_docs=False):
-        print("\n[DEBUG] Starting RAG pipeline")
-        print(f"[DEBUG] User Query: {user_query}")
+    def _submit(self, fn, *args):
+        """Run a stage on the stage pool in the caller's context (pinned index version, current trace)."""
+        return self._executor.submit(contextvars.copy_context().run, _timed, fn, *args)
 
-        # Step 1: Query Expansion
-        expansions = self.paraphraser.generate(user_query)
-        all_queries = [user_query] + expansions
+    def _paraphrase(self, user_query):
+        with self.tracer.span("paraphrase") as span:
+            expansions = self.paraphraser.generate(user_query)
+            span.set(queries=len(expansions))
+        return expansions
 
-        # Step 2: Classification
-        label_conf_pairs = self.classifier.classify_batch(all_queries)
-        labels = [label for label, _ in label_conf_pairs]
-        majority_label = Counter(labels).most_common(1)[0][0]
-        confidences = [conf for (label, conf) in label_conf_pairs if label == majority_label]
-        avg_classification_conf = sum(confidences) / len(confidences) if confidences else 0
+    def _classify(self, queries, stage):
+        with self.tracer.span(stage, queries=len(queries)):
+            return self.classifier.classify_batch(queries) if queries else []
 
-        filtered_queries = [q for q, (label, _) in zip(all_queries, label_conf_pairs) if label == majority_label or q == user_query]
+    def _prefetch(self, user_query):
+        with self.tracer.span("retrieval_prefetch"):
+            return self.retriever.prefetch(user_query)
 
-        print("\n[DEBUG] Predicted Categories:")
-        for i, (q, (label, conf)) in enumerate(zip(all_queries, label_conf_pairs)):
-            print(f"  Q{i+1}: '{q}' -> Category: {label} (Conf: {round(conf, 3)})")
-        print(f"[DEBUG] Final Category: {majority_label}")
-        print(f"[DEBUG] Avg Classification Confidence: {round(avg_classification_conf, 4)}")
+    def _stream_answer(self, inputs, on_token, span, deadline=None, max_tokens=None):
+        """
+        Generate from the chain's prompt piece by piece, handing each piece to
+        on_token as it arrives. Stops early when the request is cancelled or its
+        deadline passes; closing llm.stream() stops llama.cpp's decode loop.
+        """
+        start = time.perf_counter()
+        first_token_at = None
+        pieces = []
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        for piece in self.llm.stream(self.qa_chain.prompt.format(**inputs), **kwargs):
+            if deadline is not None:
+                deadline.check()
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                span.set(first_token_ms=round((first_token_at - start) * 1000))
+            pieces.append(piece)
+            if on_token is not None:
+                on_token(piece)
+            if deadline is not None and deadline.expired():
+                deadline.degrade("truncate_answer")
+                break
 
-        # Step 3: Retrieval
-        retrieved_docs = self.retriever.hybrid_search(filtered_queries)
-        print(f"[DEBUG] Retrieved {len(retrieved_docs)} documents.")
+        if first_token_at is not None:
+            self.stage_estimates.observe("prompt", (first_token_at - start) * 1000)
+            if len(pieces) > 1:
+                self.stage_estimates.observe("token", (time.perf_counter() - first_token_at) * 1000 / (len(pieces) - 1))
+        return "".join(pieces)
+
+    # === Latency budget ===
+
+    def _full_answer_ms(self):
+        return self.stage_estimates.generation_ms(getattr(self.llm, "max_tokens", None) or DEFAULT_MAX_TOKENS)
+
+    def _plan_paraphrasing(self, deadline, summarize_docs):
+        """Whether paraphrasing and classifying the paraphrases fit in the budget along with every later stage."""
+        estimates = self.stage_estimates
+        needed = estimates["paraphrase"] + estimates["classify"] + self._after_paraphrasing_ms(summarize_docs)
+        if deadline.fits(needed):
+            return True
+        deadline.degrade("skip_paraphrasing")
+        estimates.relax("paraphrase")
+        return False
+
+    def _after_paraphrasing_ms(self, summarize_docs):
+        estimates = self.stage_estimates
+        return estimates["retrieval"] + (estimates["summarize"] if summarize_docs else 0.0) + self._full_answer_ms()
+
+    def _paraphrase_timeout(self, deadline, summarize_docs):
+        """Seconds to wait for paraphrases that were started, keeping time for classifying them and what follows."""
+        if deadline.expires is None:
+            return None
+        needed = self.stage_estimates["classify"] + self._after_paraphrasing_ms(summarize_docs)
+        return max(deadline.remaining_ms() - needed, 0.0) / 1000
+
+    def _plan_retrieval(self, deadline, user_query, filtered_queries):
+        """The queries to search: only the user's when searching them all would leave no time for a short answer."""
+        estimates = self.stage_estimates
+        if len(filtered_queries) > 1 and not deadline.fits(estimates["retrieval"] + estimates.generation_ms(MIN_ANSWER_TOKENS)):
+            deadline.degrade("single_query_search")
+            return [user_query]
+        return filtered_queries
+
+    def _plan_summaries(self, deadline, summarize_docs):
+        if summarize_docs and not deadline.fits(self.stage_estimates["summarize"] + self._full_answer_ms()):
+            deadline.degrade("skip_summarization")
+            self.stage_estimates.relax("summarize")
+            return False
+        return summarize_docs
+
+    def _answer_tokens(self, deadline):
+        """max_tokens for the answer: the LLM's own unless the time left only allows fewer."""
+        estimates = self.stage_estimates
+        if deadline.expires is None or not estimates["token"]:
+            return None
+        full = getattr(self.llm, "max_tokens", None) or DEFAULT_MAX_TOKENS
+        affordable = int((deadline.remaining_ms() - estimates["prompt"]) / estimates["token"])
+        if affordable >= full:
+            return None
+        deadline.degrade("shrink_max_tokens")
+        return max(affordable, MIN_ANSWER_TOKENS)
+
+    def _answer(self, user_query, summarize_docs, filter_by_category, on_token, deadline):
+        """Steps 1-8 of _pipeline."""
+        logger.debug("Starting RAG pipeline | User Query: %s", user_query)
+
+        # Adaptive mode: the user's query alone, when its search is already convincing.
+        # Only T5 and the multi-query search are skipped: DeBERTa still labels the query
+        # (meanwhile, as both paths need it), so they report the same categories and confidences
+        fast, prefetched, classify_query = None, None, None
+        if self.adaptive:
+            deadline.check()
+            classify_query = yield _Start("classifier", self._classify, [user_query], "classify_query")
+            prefetched = yield _Call("embedder", self._prefetch, user_query)
+            fast = yield _Call("embedder", self._fast_path, user_query, prefetched)
+        if fast is not None:
+            query_pairs, _ = yield _Wait(classify_query)
+            majority_label, avg_classification_conf, _ = _vote([user_query], query_pairs)
+            retrieved_docs = fast
+            if filter_by_category:
+                retrieved_docs = yield _Call("embedder", self._retrieve, [user_query], majority_label, filter_by_category, prefetched)
+        else:
+            retrieved_docs, majority_label, avg_classification_conf = yield from self._expand_and_retrieve(
+                user_query, summarize_docs, filter_by_category, deadline, prefetched, classify_query
+            )
+
+        deadline.check()
+        unique_docs, context_docs, avg_similarity = yield _Call("embedder", self._select_context, user_query, retrieved_docs)
+        if self._plan_summaries(deadline, summarize_docs):
+            context = yield _Call("summarizer", self._join_context, context_docs, True)
+        else:
+            context = self._join_context(context_docs, False)
+
+        # Step 7: Answer Generation
+        deadline.check()
+        answer = yield _Call("llm", self._generate, {
+            "query": user_query,
+            "context": context,
+            "category": majority_label
+        }, on_token, deadline)
+
+        result = yield _Call(
+            "embedder", self._confidence, answer, user_query, majority_label, avg_classification_conf,
+            avg_similarity, unique_docs, context_docs, context
+        )
+        result["retrieval_path"] = "fast" if fast is not None else "expanded"
+        return result
+
+    def _confidence(self, answer, user_query, majority_label, avg_classification_conf, avg_similarity, unique_docs, context_docs, context):
+        """Step 8: Confidence Score Calculation."""
+        with self.tracer.span("confidence") as span:
+            cache_hits = query_cache_hits()
+            answer_vec = np.array(get_cached_embedding(answer))
+            query_vec = np.array(get_cached_embedding(user_query))
+            result = self._build_result(
+                answer, answer_vec, query_vec, majority_label, avg_classification_conf,
+                avg_similarity, unique_docs, context_docs, context
+            )
+            span.set(cache_hits=query_cache_hits() - cache_hits)
+        return result
+
+    def _fast_path(self, user_query, prefetched):
+        """
+        Adaptive mode's check of the user's query's own search: kept when its
+        best hit (by cosine similarity to the stored chunk vectors) reaches
+        fast_path_min_score and leads the next one by fast_path_min_margin.
+        Returns the search's hits, or None to expand the query.
+        """
+        with self.tracer.span("fast_path") as span:
+            hits = self.retriever.hybrid_search([user_query], prefetched=prefetched)
+            reranked = self.retriever.rerank(user_query, hits)
+            top_score = reranked[0][0] if reranked else 0.0
+            margin = top_score - reranked[1][0] if len(reranked) > 1 else top_score
+            taken = top_score >= self.fast_path_min_score and margin >= self.fast_path_min_margin
+            span.set(taken=taken, top_score=round(top_score, 4), margin=round(margin, 4))
+            logger.debug("Fast path %s: top score %.4f, margin %.4f", "taken" if taken else "declined", top_score, margin)
+            return hits if taken else None
+
+    def _expand_and_retrieve(self, user_query, summarize_docs, filter_by_category, deadline, prefetched=None, classify_query=None):
+        """
+        Steps 1-3 of _pipeline: paraphrase and classify the query, then search
+        with the paraphrases that agree. The user's query's search and
+        classification are reused when the fast path already started them.
+        """
+        tracer = self.tracer
+        estimates = self.stage_estimates
+
+        # Steps 1-3 run as a small dependency graph: paraphrasing, classifying the user's
+        # query and searching for it start together; only the paraphrases wait for T5.
+        # Each stage's output is the same as in sequence, so results do not depend on timing
+        # (unless the budget runs short and paraphrases are dropped).
+        with tracer.span("parallel_stages") as fan_out_span:
+            fan_out_start = time.perf_counter()
+            paraphrase = None
+            if self._plan_paraphrasing(deadline, summarize_docs):
+                paraphrase = yield _Start("paraphraser", self._paraphrase, user_query)
+            if classify_query is None:
+                classify_query = yield _Start("classifier", self._classify, [user_query], "classify_query")
+            prefetch = None
+            if prefetched is None:
+                prefetch = yield _Start("embedder", self._prefetch, user_query)
+
+            # Step 1: Query Expansion (abandoned to T5 if it would eat the time later stages need)
+            expansions, paraphrase_ms = [], 0.0
+            if paraphrase is not None:
+                try:
+                    expansions, paraphrase_ms = yield _Wait(paraphrase, self._paraphrase_timeout(deadline, summarize_docs))
+                    estimates.observe("paraphrase", paraphrase_ms)
+                except TimeoutError:
+                    deadline.degrade("skip_paraphrasing")
+            all_queries = [user_query] + expansions
+            deadline.check()
+
+            # Step 2: Classification, while the paraphrases are embedded for the search
+            classify = yield _Start("classifier", self._classify, expansions, "classify")
+            embed = (yield _Start("embedder", embed_queries, expansions)) if expansions else None
+            expansion_pairs, classify_ms = yield _Wait(classify)
+            if expansions:
+                estimates.observe("classify", classify_ms)
+            query_pairs, classify_query_ms = yield _Wait(classify_query)
+            if embed is not None:
+                yield _Wait(embed)
+            label_conf_pairs = query_pairs + expansion_pairs
+            majority_label, avg_classification_conf, filtered_queries = _vote(all_queries, label_conf_pairs)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Predicted Categories:\n%s", "\n".join(
+                    f"  Q{i+1}: '{q}' -> Category: {label} (Conf: {round(conf, 3)})"
+                    for i, (q, (label, conf)) in enumerate(zip(all_queries, label_conf_pairs))
+                ))
+            logger.debug("Final Category: %s | Avg Classification Confidence: %.4f", majority_label, avg_classification_conf)
+
+            # Step 3: Retrieval (optionally narrowed to chunks tagged with the predicted category);
+            # the unfiltered search reuses the rows already fetched for the user's query
+            prefetch_ms = 0.0
+            if prefetch is not None:
+                prefetched, prefetch_ms = yield _Wait(prefetch)
+            filtered_queries = self._plan_retrieval(deadline, user_query, filtered_queries)
+            retrieved_docs, retrieval_ms = yield _Call("embedder", _timed, self._retrieve, filtered_queries, majority_label, filter_by_category, prefetched)
+            estimates.observe("retrieval", retrieval_ms)
+
+            # Critical path: what these stages would take back to back vs. the time they took overlapped
+            serial_ms = paraphrase_ms + classify_query_ms + classify_ms + prefetch_ms + retrieval_ms
+            wall_ms = (time.perf_counter() - fan_out_start) * 1000
+            fan_out_span.set(serial_ms=round(serial_ms), critical_path_ms=round(wall_ms), saved_ms=round(serial_ms - wall_ms))
+        logger.debug("Retrieved %d documents.", len(retrieved_docs))
+        logger.debug("Overlapped stages: %.1f ms back to back, %.1f ms on the critical path", serial_ms, wall_ms)
+        return retrieved_docs, majority_label, avg_classification_conf
+
+    def _retrieve(self, filtered_queries, majority_label, filter_by_category, prefetched=None):
+        """Step 3: Retrieval (optionally narrowed to chunks tagged with the predicted category)."""
+        with self.tracer.span("retrieval", queries=len(filtered_queries)) as span:
+            retrieved_docs = []
+            if filter_by_category and majority_label != "general":
+                retrieved_docs = self.retriever.hybrid_search(filtered_queries, filters=MetadataFilter(category=majority_label))
+                logger.debug("Category-filtered retrieval (%s): %d documents.", majority_label, len(retrieved_docs))
+                span.set(category_filtered=bool(retrieved_docs))
+            if not retrieved_docs:
+                retrieved_docs = self.retriever.hybrid_search(filtered_queries, prefetched=prefetched)
+            span.set(candidates=len(retrieved_docs))
+        return retrieved_docs
+
+    def _generate(self, inputs, on_token=None, deadline=None):
+        """Step 7: Answer Generation, streamed through on_token, or token by token under a budget or cancel event."""
+        logger.debug("Invoking LLM QA Chain...")
+        with self.tracer.span("generate") as span:
+            if on_token is None and (deadline is None or not deadline.active):
+                answer = self.qa_chain.invoke(inputs)['text']
+            else:
+                max_tokens = self._answer_tokens(deadline) if deadline is not None else None
+                if max_tokens:
+                    span.set(max_tokens=max_tokens)
+                answer = self._stream_answer(inputs, on_token, span, deadline, max_tokens)
+            if span.recording:
+                span.set(
+                    prompt_tokens=self.llm.get_num_tokens(self.qa_chain.prompt.format(**inputs)),
+                    completion_tokens=self.llm.get_num_tokens(answer)
+                )
+        logger.debug("Answer: %s", answer)
+        return answer
+
+    def _build_context(self, user_query, retrieved_docs, summarize_docs):
+        """Steps 4-6: rerank, deduplicate, pick context chunks with MMR and join (or summarize) them."""
+        unique_docs, context_docs, avg_similarity = self._select_context(user_query, retrieved_docs)
+        context = self._join_context(context_docs, summarize_docs)
+        return unique_docs, context_docs, context, avg_similarity
+
+    def _select_context(self, user_query, retrieved_docs):
+        """Steps 4-6 without the summarizer: rerank, deduplicate and pick the context chunks with MMR."""
+        tracer = self.tracer
 
         # Step 4: Reranking
-        reranked = self.retriever.rerank(user_query, retrieved_docs)
+        with tracer.span("rerank", candidates=len(retrieved_docs)) as span:
+            cache_hits = query_cache_hits()
+            reranked = self.retriever.rerank(user_query, retrieved_docs)
+            span.set(cache_hit=query_cache_hits() > cache_hits)
         top_similarities = [sim for sim, _, _ in reranked[:5]]
         avg_similarity = sum(top_similarities) / len(top_similarities)
 
@@ -59,34 +629,38 @@ class RAGPipeline:
                 seen_docs.add(doc)
                 unique_docs.append((score, doc, meta))
 
-        print(f"[DEBUG] Unique Documents After Deduplication: {len(unique_docs)}")
+        logger.debug("Unique Documents After Deduplication: %d", len(unique_docs))
 
-        # Step 6: Context Building
+        # Step 6: Context Building (MMR keeps the context slots from repeating one another)
         top_k = 3
-        context = "\n\n".join([
-            self.summarizer.summarize_if_needed(doc) if summarize_docs else doc
-            for _, doc, _ in unique_docs[:top_k]
-        ])
-        print(f"[DEBUG] Context length: {len(context)}")
+        with tracer.span("mmr", candidates=len(unique_docs)) as span:
+            context_docs = self.retriever.mmr(unique_docs, top_k)
+            span.set(selected=len(context_docs))
+        logger.debug("MMR selected chunks: %s", [meta["chunk_id"] for _, _, meta in context_docs])
+        return unique_docs, context_docs, avg_similarity
 
-        # Step 7: Answer Generation
-        print("[DEBUG] Invoking LLM QA Chain...")
-        answer = self.qa_chain.invoke({
-            "query": user_query,
-            "context": context,
-            "category": majority_label
-        })['text']
-
-        print(f"[DEBUG] Answer: {answer}")
+    def _join_context(self, context_docs, summarize_docs):
+        """Context text from the selected chunks, each summarized first when summarize_docs is set."""
+        start = time.perf_counter()
+        with self.tracer.span("summarize", documents=len(context_docs) if summarize_docs else 0) as span:
+            context_parts = [
+                self.summarizer.summarize_if_needed(doc) if summarize_docs else doc
+                for _, doc, _ in context_docs
+            ]
+            context = "\n\n".join(context_parts)
+            span.set(summarized=sum(part != doc for part, (_, doc, _) in zip(context_parts, context_docs)), context_chars=len(context))
+        if summarize_docs:
+            self.stage_estimates.observe("summarize", (time.perf_counter() - start) * 1000)
+        logger.debug("Context length: %d", len(context))
+        return context
 
-        # Step 8: Confidence Score Calculation
-        answer_vec = np.array(get_cached_embedding(answer))
-        doc_sims = [
-            FAISSRetriever.cosine_similarity(answer_vec, np.array(get_cached_embedding(doc)))
-            for _, doc, _ in unique_docs[:top_k]
-        ]
-        avg_answer_alignment = sum(doc_sims) / len(doc_sims)
-        query_vec = np.array(get_cached_embedding(user_query))
+    def _build_result(self, answer, answer_vec, query_vec, majority_label, avg_classification_conf, avg_similarity, unique_docs, context_docs, context):
+        """Steps 8-9: confidence score from the answer/query embeddings, sources and highlighted chunks."""
+        doc_sims = self.retriever.similarity_to_chunks(
+            answer_vec,
+            [meta["chunk_id"] for _, _, meta in context_docs]
+        )
+        avg_answer_alignment = float(np.mean(doc_sims))
         query_answer_sim = FAISSRetriever.cosine_similarity(query_vec, answer_vec)
 
         final_confidence = round((
@@ -97,7 +671,7 @@ class RAGPipeline:
         ) * 100, 2)
 
         # Step 9: Metadata + Highlight Preparation
-        top_sources = [meta for _, _, meta in unique_docs[:top_k]]
+        top_sources = [meta for _, _, meta in context_docs]
         highlighted_chunks = [
             f"""
             <div style="
@@ -128,7 +702,7 @@ class RAGPipeline:
                 ">{doc}</pre>
             </div>
             """
-            for _, doc, meta in unique_docs[:top_k]
+            for _, doc, meta in context_docs
         ]
 
         return {
@@ -140,5 +714,21 @@ class RAGPipeline:
             "confidence_score": final_confidence,
             "highlights": highlighted_chunks
         }
-    
 
+
+
+def _vote(queries, label_conf_pairs):
+    """Majority label of a query and its paraphrases, its mean confidence, and the queries that agree with it (the first always kept)."""
+    labels = [label for label, _ in label_conf_pairs]
+    majority_label = Counter(labels).most_common(1)[0][0]
+    confidences = [conf for (label, conf) in label_conf_pairs if label == majority_label]
+    avg_classification_conf = sum(confidences) / len(confidences) if confidences else 0
+    filtered_queries = [q for q, (label, _) in zip(queries, label_conf_pairs) if label == majority_label or q == queries[0]]
+    return majority_label, avg_classification_conf, filtered_queries
+
+
+def _timed(fn, *args):
+    """Call fn(*args); returns (result, elapsed milliseconds)."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
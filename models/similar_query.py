@@ -1,8 +1,11 @@
 # models/similar_query.py
 
+import logging
 import torch
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
 
+logger = logging.getLogger(__name__)
+
 
 class QueryParaphraser:
     def __init__(self, model_name="prithivida/parrot_paraphraser_on_T5", device="auto"):
@@ -30,16 +33,26 @@ class QueryParaphraser:
         """
         prompt = f"paraphrase the question in different ways: {query}:"
 
-        print("[DEBUG] Generating paraphrases...")
+        logger.debug("Generating paraphrases...")
         responses = self.paraphraser(prompt, num_return_sequences=num_questions)
         queries = [resp["generated_text"].strip() for resp in responses]
 
-        print("[DEBUG] Paraphrased Queries:")
-        for i, q in enumerate(queries, 1):
-            print(f"{i}. {q}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Paraphrased Queries:\n%s", "\n".join(f"{i}. {q}" for i, q in enumerate(queries, 1)))
 
         return queries
 
+    def generate_batch(self, queries: list[str], num_questions: int = 5, batch_size: int = 8) -> list[list[str]]:
+        """
+        Paraphrases for many queries in one pipeline call, `batch_size` prompts per model forward.
+        Returns one list of paraphrases per query.
+        """
+        if not queries:
+            return []
+        prompts = [f"paraphrase the question in different ways: {query}:" for query in queries]
+        responses = self.paraphraser(prompts, num_return_sequences=num_questions, batch_size=batch_size)
+        return [[resp["generated_text"].strip() for resp in group] for group in responses]
+
 
 # from models.similar_query import QueryParaphraser
 
@@ -1,7 +1,10 @@
 # models/summarizer.py
 
+import logging
 from transformers import pipeline
 
+logger = logging.getLogger(__name__)
+
 
 class Summarizer:
     def __init__(self, model_name="sshleifer/distilbart-cnn-12-6"):
@@ -21,7 +24,7 @@ class Summarizer:
         """
         words = text.split()
         if len(words) > max_words:
-            print(f"[INFO] Text exceeds {max_words} words. Summarizing...")
+            logger.info("Text exceeds %d words. Summarizing...", max_words)
             summary = self.summarizer(
                 text,
                 max_length=512,
@@ -0,0 +1,272 @@
+# models/tracing.py
+
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# RAG_TRACING=0 swaps in the no-op tracer
+TRACING_ENABLED = os.environ.get("RAG_TRACING", "1") != "0"
+
+# Upper bounds (ms) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000)
+
+# Completed request traces kept in memory for export
+KEEP_TRACES = 50
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds, in the Prometheus cumulative layout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf when it falls past the last bound)."""
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen and seen >= q * self.count:
+                return bound
+        return 0.0
+
+    def cumulative(self):
+        """(le, count) pairs, le being a bucket bound or "+Inf"."""
+        seen = 0
+        for bound, n in zip(self.buckets + ("+Inf",), self.counts):
+            seen += n
+            yield bound, seen
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum, 3),
+            "mean_ms": round(self.sum / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "buckets": {str(bound): count for bound, count in self.cumulative()}
+        }
+
+
+class Span:
+    """One timed stage of a request, with free-form attributes (token counts, candidates, cache hits...)."""
+
+    recording = True
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.start = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "duration_ms": round(self.duration_ms, 3), "attributes": self.attributes}
+
+
+class Trace:
+    """The spans of one request, in the order they finished."""
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "attributes": self.attributes,
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+
+class Tracer:
+    """
+    In-process tracing for the RAG pipeline.
+
+    `trace()` wraps one request and `span()` one stage of it. Every finished
+    span feeds a latency histogram per stage name, and its integer attributes
+    (booleans count as 0/1) are summed into per-stage counters, so e.g.
+    `cache_hit=True` or `candidates=40` add up across requests. The last
+    KEEP_TRACES traces are kept whole. Everything can be exported as JSON or
+    in the Prometheus text format.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS, keep_traces: int = KEEP_TRACES):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.traces = deque(maxlen=keep_traces)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Collect the spans of one request; the request as a whole is recorded as stage `name`."""
+        trace = Trace(name, attributes)
+        token = _current_trace.set(trace)
+        try:
+            with self.span(name, **attributes):
+                yield trace
+        finally:
+            _current_trace.reset(token)
+            with self._lock:
+                self.traces.append(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end()
+            self._record(span)
+
+    def _record(self, span: Span):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(span)
+        with self._lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram(self.buckets)
+            histogram.observe(span.duration_ms)
+            counters = self.counters.setdefault(span.name, {})
+            for key, value in span.attributes.items():
+                if isinstance(value, int):
+                    counters[key] = counters.get(key, 0) + int(value)
+        logger.debug("%s: %.1f ms %s", span.name, span.duration_ms, span.attributes)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.traces.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                "counters": {name: dict(counters) for name, counters in self.counters.items() if counters},
+                "traces": [trace.to_dict() for trace in self.traces]
+            }
+
+    def export_json(self, path: str = None) -> str:
+        """Histograms, counters and recent traces as JSON; also written to `path` when given."""
+        text = json.dumps(self.snapshot(), indent=2, default=str)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+    def export_prometheus(self, path: str = None, prefix: str = "rag") -> str:
+        """Histograms and counters in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_stage_latency_ms Latency of RAG pipeline stages in milliseconds.",
+            f"# TYPE {prefix}_stage_latency_ms histogram"
+        ]
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{prefix}_stage_latency_ms_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_stage_latency_ms_sum{{stage="{name}"}} {histogram.sum:.3f}')
+                lines.append(f'{prefix}_stage_latency_ms_count{{stage="{name}"}} {histogram.count}')
+            lines.append(f"# HELP {prefix}_stage_attribute_total Sum of integer span attributes per stage.")
+            lines.append(f"# TYPE {prefix}_stage_attribute_total counter")
+            for name, counters in sorted(self.counters.items()):
+                for key, value in sorted(counters.items()):
+                    lines.append(f'{prefix}_stage_attribute_total{{stage="{name}",attribute="{key}"}} {value}')
+        text = "\n".join(lines) + "\n"
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+
+class _NoOpSpan:
+    recording = False
+    duration_ms = 0.0
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoOpSpan()
+
+
+class NoOpTracer:
+    """Drop-in Tracer that records nothing, for when tracing is off."""
+
+    enabled = False
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        yield None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        yield _NOOP_SPAN
+
+    def reset(self):
+        pass
+
+    def snapshot(self) -> dict:
+        return {"stages": {}, "counters": {}, "traces": []}
+
+    def export_json(self, path: str = None) -> str:
+        text = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+    def export_prometheus(self, path: str = None, prefix: str = "rag") -> str:
+        if path:
+            open(path, "w", encoding="utf-8").close()
+        return ""
+
+
+# Shared by every pipeline unless one is given its own
+default_tracer = Tracer() if TRACING_ENABLED else NoOpTracer()
+
+
+# from models.tracing import default_tracer
+
+# with default_tracer.trace("rag_run", query="..."):
+#     with default_tracer.span("retrieval") as span:
+#         span.set(candidates=40, cache_hit=True)
+# print(default_tracer.export_prometheus())
+# default_tracer.export_json("exports/rag_metrics.json")
@@ -0,0 +1,194 @@
+# vectorstore/ann.py
+
+import math
+import time
+import argparse
+import numpy as np
+import faiss
+
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "hnsw", "sq8"]
+METRICS = ["l2", "cosine"]
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+TRAIN_SAMPLE_SIZE = 100_000
+
+
+def default_params(index_type: str, n_vectors: int, dim: int, metric: str = "l2") -> dict:
+    """Build/search parameters sized for the corpus; persisted next to the index."""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}. Expected one of {METRICS}")
+    params = {"index_type": index_type, "dim": dim, "metric": metric}
+    if index_type.startswith("ivf"):
+        nlist = max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), max(n_vectors // 39, 1), 65536))
+        params["nlist"] = nlist
+        params["nprobe"] = min(nlist, max(8, nlist // 16))
+    if index_type == "ivf_pq":
+        # 8 dims per sub-quantizer; 8-bit codes once there is enough data to train 256 centroids
+        params["pq_m"] = max(m for m in range(1, dim // 8 + 1) if dim % m == 0)
+        params["pq_nbits"] = 8 if n_vectors >= 256 * 39 else max(1, min(8, int(math.log2(max(n_vectors, 2)))))
+    if index_type == "hnsw":
+        params["hnsw_m"] = HNSW_M
+        params["efSearch"] = 64
+    return params
+
+
+def needs_training(index_type: str) -> bool:
+    """Whether the index type learns centroids/codebooks from data before vectors can be added."""
+    return index_type.startswith("ivf") or index_type == "sq8"
+
+
+def is_cosine(params: dict) -> bool:
+    return params.get("metric", "l2") == "cosine"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Return an L2-normalized float32 copy of a vector or matrix (as a 2-D array)."""
+    vectors = np.array(vectors, dtype="float32", order="C", ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def prepare_vectors(vectors: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Convert embeddings into the form stored in / searched against the index.
+    Cosine indexes hold L2-normalized vectors, so inner product == cosine similarity.
+    """
+    if is_cosine(params):
+        return normalize(vectors)
+    return np.array(vectors, dtype="float32", order="C", ndmin=2)
+
+
+def create_index(dim: int, params: dict):
+    """Create an untrained, ID-mapped FAISS index for the configured index type and metric."""
+    index_type = params["index_type"]
+    cosine = is_cosine(params)
+    metric = faiss.METRIC_INNER_PRODUCT if cosine else faiss.METRIC_L2
+    if index_type == "flat":
+        base = faiss.IndexFlatIP(dim) if cosine else faiss.IndexFlatL2(dim)
+    elif index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dim) if cosine else faiss.IndexFlatL2(dim)
+        base = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], metric)
+    elif index_type == "ivf_pq":
+        quantizer = faiss.IndexFlatIP(dim) if cosine else faiss.IndexFlatL2(dim)
+        base = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pq_m"], params["pq_nbits"], metric)
+    elif index_type == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, params["hnsw_m"], metric)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "sq8":
+        base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}. Expected one of {INDEX_TYPES}")
+    return faiss.IndexIDMap2(base)
+
+
+def train_index(index, embeddings: np.ndarray, sample_size: int = TRAIN_SAMPLE_SIZE, seed: int = 0):
+    """Train on a random sample of the corpus (no-op for index types that need no training)."""
+    if index.is_trained or len(embeddings) == 0:
+        return
+    if len(embeddings) > sample_size:
+        rng = np.random.default_rng(seed)
+        sample = embeddings[np.sort(rng.choice(len(embeddings), sample_size, replace=False))]
+    else:
+        sample = embeddings
+    start = time.perf_counter()
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+    print(f"[DEBUG] Trained index on {len(sample)} vectors in {time.perf_counter() - start:.2f}s")
+
+
+def apply_search_params(index, params: dict):
+    """Apply persisted query-time parameters (nprobe, efSearch) to a loaded index."""
+    if not params:
+        return
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if "nprobe" in params and hasattr(base, "nprobe"):
+        base.nprobe = params["nprobe"]
+    if "efSearch" in params and hasattr(base, "hnsw"):
+        base.hnsw.efSearch = params["efSearch"]
+
+
+def build_ann_index(embeddings: np.ndarray, params: dict, ids: np.ndarray = None):
+    """Create, train and fill an index from an embedding matrix."""
+    embeddings = prepare_vectors(embeddings, params)
+    index = create_index(embeddings.shape[1], params)
+    train_index(index, embeddings)
+    apply_search_params(index, params)
+    if ids is None:
+        ids = np.arange(len(embeddings), dtype="int64")
+    index.add_with_ids(embeddings, ids)
+    return index
+
+
+def load_index_vectors(index) -> np.ndarray:
+    """Recover the stored vectors of an index (exact for flat, approximate for quantized types)."""
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base, faiss.IndexIVF):
+        base.make_direct_map()
+    return base.reconstruct_n(0, base.ntotal)
+
+
+def compare_index_types(embeddings: np.ndarray, index_types=None, k: int = 10, n_queries: int = 200, metric: str = "l2", seed: int = 0):
+    """
+    Benchmark ANN index types against the exact flat index.
+    Returns one row per index type with recall@k, p50/p99 single-query latency,
+    build time and serialized size.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    index_types = index_types or INDEX_TYPES
+    rng = np.random.default_rng(seed)
+    exact_params = default_params("flat", len(embeddings), embeddings.shape[1], metric)
+    queries = embeddings[rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)]
+    queries = prepare_vectors(queries, exact_params)
+
+    exact = build_ann_index(embeddings, exact_params)
+    _, truth = exact.search(queries, k)
+
+    report = []
+    for index_type in index_types:
+        params = default_params(index_type, len(embeddings), embeddings.shape[1], metric)
+        start = time.perf_counter()
+        index = build_ann_index(embeddings, params)
+        build_time = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for i in range(len(queries)):
+            t0 = time.perf_counter()
+            _, found = index.search(queries[i:i + 1], k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits += len(np.intersect1d(found[0], truth[i]))
+
+        report.append({
+            "index_type": index_type,
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+            "build_s": round(build_time, 2),
+            "size_mb": round(len(faiss.serialize_index(index)) / 1e6, 2),
+            "params": {key: value for key, value in params.items() if key not in ("index_type", "dim", "metric")}
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ANN index types against exact search on an existing index.")
+    parser.add_argument("--index", default="faiss_index.idx")
+    parser.add_argument("--types", nargs="+", default=INDEX_TYPES, choices=INDEX_TYPES)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--metric", default="l2", choices=METRICS)
+    args = parser.parse_args()
+
+    embeddings = load_index_vectors(faiss.read_index(args.index))
+    print(f"[INFO] Benchmarking {len(args.types)} index types on {len(embeddings)} vectors ({args.metric})")
+    for row in compare_index_types(embeddings, args.types, k=args.k, n_queries=args.queries, metric=args.metric):
+        print(
+            f"{row['index_type']:>9}  recall@{args.k}={row[f'recall@{args.k}']:.4f}  "
+            f"p50={row['p50_ms']:.3f}ms  p99={row['p99_ms']:.3f}ms  "
+            f"build={row['build_s']:.2f}s  size={row['size_mb']:.2f}MB  {row['params']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
+
+# python -m vectorstore.ann --index faiss_index.idx --types flat ivf_flat hnsw sq8 -k 10
@@ -0,0 +1,57 @@
+# vectorstore/artifacts.py
+
+import os
+import json
+import numpy as np
+
+
+def artifact_path(index_path: str, name: str) -> str:
+    """Path of a sidecar file stored next to a FAISS index (e.g. faiss_index_manifest.json)."""
+    base, _ = os.path.splitext(index_path)
+    return f"{base}_{name}"
+
+
+def load_json(path: str, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, data):
+    """Write JSON atomically so readers never see a half-written file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_vectors(path: str, vectors: np.ndarray):
+    """Write a raw float32 vector matrix (row i == chunk ID i)."""
+    tmp_path = f"{path}.tmp"
+    np.ascontiguousarray(vectors, dtype="float32").tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def append_vectors(path: str, vectors: np.ndarray):
+    with open(path, "ab") as f:
+        f.write(np.ascontiguousarray(vectors, dtype="float32").tobytes())
+
+
+def clear_vectors(path: str, ids, dim: int):
+    """Zero the rows of removed chunk IDs in place."""
+    zeros = bytes(4 * dim)
+    with open(path, "r+b") as f:
+        for chunk_id in ids:
+            f.seek(chunk_id * 4 * dim)
+            f.write(zeros)
+
+
+def load_vectors(path: str, dim: int):
+    """Memory-map a raw float32 vector matrix; returns None when it does not exist."""
+    if not os.path.exists(path):
+        return None
+    n_rows = os.path.getsize(path) // (4 * dim)
+    if n_rows == 0:
+        return np.empty((0, dim), dtype="float32")
+    return np.memmap(path, dtype="float32", mode="r", shape=(n_rows, dim))
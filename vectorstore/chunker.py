@@ -0,0 +1,203 @@
+# vectorstore/chunker.py
+
+import re
+import time
+import argparse
+from bisect import bisect_left
+from collections import deque
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+class TextChunker:
+    """
+    Recursive separator splitter (same policy as LangChain's
+    RecursiveCharacterTextSplitter) that works on character offsets.
+
+    Text is split on the first separator that occurs, pieces that are still too
+    long are split again on the next one, and neighbouring pieces are merged
+    greedily into chunks of at most `chunk_size` with up to `chunk_overlap` of
+    overlap. Every chunk is produced as a (start, end) span of the original
+    text, so offsets are exact even when text repeats, and no chunk text is
+    copied until it is asked for.
+
+    With a `tokenizer` (a Hugging Face fast tokenizer, e.g. the embedding
+    model's), `chunk_size` and `chunk_overlap` count tokens instead of
+    characters. The file is tokenized once and span lengths are looked up by
+    bisecting the token offsets, so chunks never exceed the model's window.
+    """
+
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 64, separators: list[str] = None, tokenizer=None):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or DEFAULT_SEPARATORS
+        self._patterns = [re.compile(re.escape(separator)) if separator else None for separator in self.separators]
+        self.tokenizer = tokenizer
+
+    def split_spans(self, text: str) -> list[tuple[int, int]]:
+        """Return (start, end) character offsets of every chunk, in document order."""
+        if self.tokenizer is not None:
+            offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+            token_starts = [start for start, _ in offsets]
+        else:
+            token_starts = None
+
+        spans = []
+        self._split(text, 0, len(text), 0, token_starts, spans)
+        return [span for span in (_strip(text, start, end) for start, end in spans) if span[1] > span[0]]
+
+    def split_text(self, text: str) -> list[str]:
+        """Drop-in for RecursiveCharacterTextSplitter.split_text."""
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def _length(self, start: int, end: int, token_starts) -> int:
+        if token_starts is None:
+            return end - start
+        return bisect_left(token_starts, end) - bisect_left(token_starts, start)
+
+    def _split(self, text, start, end, level, token_starts, out):
+        # First separator (from `level` on) that occurs in the span; "" always matches
+        while self._patterns[level] is not None and self._patterns[level].search(text, start, end) is None:
+            level += 1
+        pattern = self._patterns[level]
+        if pattern is None:
+            out.extend(self._hard_split(start, end, token_starts))
+            return
+
+        # The separator stays at the front of the piece that follows it, so pieces tile the span
+        bounds = [start] + [match.start() for match in pattern.finditer(text, start, end) if match.start() > start] + [end]
+        good = []
+        for piece_start, piece_end in zip(bounds, bounds[1:]):
+            if self._length(piece_start, piece_end, token_starts) < self.chunk_size:
+                good.append((piece_start, piece_end))
+                continue
+            if good:
+                out.extend(self._merge(good, token_starts))
+                good = []
+            if level + 1 < len(self._patterns):
+                self._split(text, piece_start, piece_end, level + 1, token_starts, out)
+            else:
+                out.append((piece_start, piece_end))
+        if good:
+            out.extend(self._merge(good, token_starts))
+
+    def _merge(self, pieces, token_starts):
+        """Greedily pack consecutive pieces into chunks, carrying an overlap tail into the next chunk."""
+        chunks, window = [], deque()
+        for piece_start, piece_end in pieces:
+            if window and self._length(window[0][0], piece_end, token_starts) > self.chunk_size:
+                chunks.append((window[0][0], window[-1][1]))
+                while window and (
+                    self._length(window[0][0], window[-1][1], token_starts) > self.chunk_overlap
+                    or self._length(window[0][0], piece_end, token_starts) > self.chunk_size
+                ):
+                    window.popleft()
+            window.append((piece_start, piece_end))
+        if window:
+            chunks.append((window[0][0], window[-1][1]))
+        return chunks
+
+    def _hard_split(self, start, end, token_starts):
+        """Fixed windows for text with no separators left (e.g. one huge token run)."""
+        step = self.chunk_size - self.chunk_overlap
+        if token_starts is None:
+            return [(i, min(i + self.chunk_size, end)) for i in range(start, end, step)]
+
+        first, last = bisect_left(token_starts, start), bisect_left(token_starts, end)
+        spans = []
+        for i in range(first, last, step):
+            window_end = token_starts[i + self.chunk_size] if i + self.chunk_size < last else end
+            spans.append((max(token_starts[i], start) if i > first else start, window_end))
+            if i + self.chunk_size >= last:
+                break
+        return spans or [(start, end)]
+
+
+def _strip(text: str, start: int, end: int) -> tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def benchmark_chunkers(texts: list[str], chunk_size: int = 512, chunk_overlap: int = 64) -> list[dict]:
+    """
+    Time TextChunker against LangChain's splitter plus the str.find offset
+    lookup the index build used to do. Also counts LangChain chunks whose
+    recovered offsets do not point at the chunk (repeated text).
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    total_mb = sum(len(text) for text in texts) / 1e6
+    rows = []
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    start = time.perf_counter()
+    n_chunks = wrong = 0
+    for text in texts:
+        chunks = splitter.split_text(text)
+        previous = -1
+        for chunk in chunks:
+            # Chunks come in document order, so a hit at or before the previous chunk is a wrong offset
+            offset = text.find(chunk)
+            if offset <= previous:
+                wrong += 1
+                offset = text.find(chunk, previous + 1)
+            previous = offset
+        n_chunks += len(chunks)
+    rows.append({"chunker": "langchain+find", "seconds": time.perf_counter() - start, "chunks": n_chunks, "wrong_offsets": wrong})
+
+    chunker = TextChunker(chunk_size, chunk_overlap)
+    start = time.perf_counter()
+    n_chunks = sum(len(chunker.split_spans(text)) for text in texts)
+    rows.append({"chunker": "TextChunker", "seconds": time.perf_counter() - start, "chunks": n_chunks, "wrong_offsets": 0})
+
+    for row in rows:
+        row["mb_per_sec"] = total_mb / row["seconds"] if row["seconds"] > 0 else float("inf")
+    return rows
+
+
+def _synthetic_text(size_mb: float, seed: int = 0) -> str:
+    """Paragraphs of datasheet-like text with a repeated header, the case str.find gets wrong."""
+    import random
+
+    rng = random.Random(seed)
+    words = "arista eos switch port 100g latency buffer telemetry vlan bgp evpn license warranty advisory".split()
+    header = "Arista Networks | Confidential | Product Documentation\n\n"
+    parts, size = [], 0
+    while size < size_mb * 1e6:
+        paragraph = header + "\n".join(" ".join(rng.choice(words) for _ in range(rng.randint(5, 30))) for _ in range(rng.randint(2, 12))) + "\n\n"
+        parts.append(paragraph)
+        size += len(paragraph)
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TextChunker against LangChain's RecursiveCharacterTextSplitter.")
+    parser.add_argument("files", nargs="*", help=".txt files to chunk (default: one synthetic file)")
+    parser.add_argument("--size-mb", type=float, default=5.0, help="size of the synthetic file")
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.files:
+        texts = []
+        for path in args.files:
+            with open(path, "r", encoding="utf-8") as f:
+                texts.append(f.read())
+    else:
+        texts = [_synthetic_text(args.size_mb)]
+
+    print(f"{'chunker':<16}{'seconds':>10}{'MB/s':>10}{'chunks':>10}{'wrong offsets':>15}")
+    for row in benchmark_chunkers(texts, args.chunk_size, args.chunk_overlap):
+        print(f"{row['chunker']:<16}{row['seconds']:>10.3f}{row['mb_per_sec']:>10.2f}{row['chunks']:>10}{row['wrong_offsets']:>15}")
+
+
+if __name__ == "__main__":
+    main()
+
+# python -m vectorstore.chunker --size-mb 20
+# python -m vectorstore.chunker data/raw_documents/arista/products/*.txt
@@ -0,0 +1,110 @@
+# vectorstore/dedup.py
+
+import os
+import re
+import zlib
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+SHINGLE_SIZE = 3
+
+# 64 MinHash values per chunk, banded 8 x 8 for LSH (candidate pairs from Jaccard ~0.77 up)
+NUM_PERM = 64
+LSH_BANDS = 8
+
+# Chunks whose estimated Jaccard similarity (over word 3-shingles) reaches this are near-duplicates
+JACCARD_THRESHOLD = 0.8
+
+# Multiply-shift hash family (odd 64-bit multipliers), fixed so signatures are stable across runs
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype="uint64") * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype="uint64")
+
+
+def minhash(text: str) -> np.ndarray:
+    """
+    MinHash signature (NUM_PERM uint32 values) of a text's word 3-shingles.
+    Case, punctuation and whitespace are ignored, so re-wrapped or re-punctuated
+    copies of the same boilerplate get the same signature.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype="uint64", count=len(shingles))
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * _PERM_A + _PERM_B) >> np.uint64(32)
+    return permuted.min(axis=0).astype("uint32")
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of the canonical chunks in an index, with banded LSH lookup.
+
+    Only chunks that share a whole band of their signature are compared, and a
+    candidate counts as a near-duplicate when the fraction of equal MinHash
+    values (the Jaccard estimate) reaches `threshold`.
+    """
+
+    def __init__(self, threshold: float = JACCARD_THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // LSH_BANDS
+        self.signatures = {}
+        self._tables = [{} for _ in range(LSH_BANDS)]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _bands(self, signature: np.ndarray):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(LSH_BANDS)]
+
+    def find(self, signature: np.ndarray):
+        """Chunk ID of the most similar indexed near-duplicate of `signature`, or None."""
+        best_id, best_similarity = None, self.threshold
+        seen = set()
+        for table, key in zip(self._tables, self._bands(signature)):
+            for chunk_id in table.get(key, ()):
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                similarity = float(np.mean(self.signatures[chunk_id] == signature))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = chunk_id, similarity
+        return best_id
+
+    def add(self, chunk_id: int, signature: np.ndarray):
+        self.signatures[chunk_id] = signature
+        for table, key in zip(self._tables, self._bands(signature)):
+            table.setdefault(key, []).append(chunk_id)
+
+    def remove(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            signature = self.signatures.pop(int(chunk_id), None)
+            if signature is None:
+                continue
+            for table, key in zip(self._tables, self._bands(signature)):
+                bucket = table[key]
+                bucket.remove(int(chunk_id))
+                if not bucket:
+                    del table[key]
+
+    def save(self, path: str):
+        ids = np.fromiter(self.signatures.keys(), dtype="int64", count=len(self.signatures))
+        signatures = np.array(list(self.signatures.values()), dtype="uint32").reshape(len(ids), NUM_PERM)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=ids, signatures=signatures, threshold=np.array(self.threshold))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            index = cls(float(data["threshold"]))
+            for chunk_id, signature in zip(data["ids"].tolist(), data["signatures"]):
+                index.add(chunk_id, signature)
+        return index
+
+
+# from vectorstore.dedup import minhash, NearDuplicateIndex
+
+# dedup = NearDuplicateIndex()
+# dedup.add(0, minhash("Arista Networks | Confidential | Product Documentation ..."))
+# print(dedup.find(minhash("Arista Networks - Confidential - Product documentation ...")))  # 0
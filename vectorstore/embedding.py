@@ -1,19 +1,165 @@
 # vectorstore/embedder.py
 
+import os
+import time
+import threading
 import torch
 import numpy as np
-from functools import lru_cache
+from collections import OrderedDict
 from sentence_transformers import SentenceTransformer
 
+from vectorstore.embedding_cache import EmbeddingCache
+
 # Load model and determine device
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-@lru_cache(maxsize=1000)
+DEFAULT_BATCH_SIZE = 64
+
+# On-disk cache of corpus chunk vectors, shared by every index rebuild and process restart.
+# Only embed_documents writes to it; query and answer vectors stay in process (QUERY_CACHE_SIZE).
+EMBEDDING_CACHE_DIR = os.environ.get("RAG_EMBEDDING_CACHE_DIR", "embedding_cache")
+QUERY_CACHE_SIZE = 1000
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+# Recent query/answer vectors, shared by get_cached_embedding and embed_queries (least recently used evicted first)
+_query_vectors = OrderedDict()
+_query_vectors_lock = threading.Lock()
+_query_cache_hits = 0
+
+def corpus_cache() -> EmbeddingCache:
+    """The on-disk chunk embedding cache, opened on first use."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                EMBEDDING_CACHE_DIR,
+                EMBEDDING_MODEL_NAME,
+                embedding_model.get_sentence_embedding_dimension()
+            )
+        return _embedding_cache
+
+def _recall_queries(texts):
+    """Cached vectors of `texts` (None where missing); hits become the most recently used."""
+    global _query_cache_hits
+    vectors = []
+    with _query_vectors_lock:
+        for text in texts:
+            vector = _query_vectors.get(text)
+            if vector is not None:
+                _query_vectors.move_to_end(text)
+                _query_cache_hits += 1
+            vectors.append(vector)
+    return vectors
+
+def _remember_queries(texts, vectors):
+    with _query_vectors_lock:
+        for text, vector in zip(texts, vectors):
+            _query_vectors[text] = vector
+            _query_vectors.move_to_end(text)
+        while len(_query_vectors) > QUERY_CACHE_SIZE:
+            _query_vectors.popitem(last=False)
+
+def query_cache_hits() -> int:
+    """Hits of the in-process query cache so far; spans diff it around a stage."""
+    return _query_cache_hits
+
 def get_cached_embedding(text: str):
-    """Return cached embedding for a given text."""
-    return tuple(embedding_model.encode([text], device=device)[0])
+    """
+    Return cached embedding for a given text. Corpus chunks are read from the
+    on-disk cache; anything else is encoded and only kept in memory.
+    """
+    vector = _recall_queries([text])[0]
+    if vector is not None:
+        return tuple(vector)
+
+    stored = corpus_cache().get(text)
+    if stored is not None:
+        return tuple(stored)
+
+    vector = embedding_model.encode([text], device=device)[0]
+    _remember_queries([text], vector[None, :])
+    return tuple(vector)
+
+def _embed(texts: list[str], batch_size: int, use_cache: bool) -> tuple[np.ndarray, int]:
+    """Embed texts through the on-disk cache; returns the matrix and how many texts hit the model."""
+    dim = embedding_model.get_sentence_embedding_dimension()
+    embedding_cache = corpus_cache() if use_cache else None
+    if use_cache:
+        embeddings, missing = embedding_cache.get_many(texts)
+    else:
+        embeddings, missing = np.empty((len(texts), dim), dtype="float32"), list(range(len(texts)))
+
+    if missing:
+        to_encode = [texts[i] for i in missing]
+        encoded = embedding_model.encode(
+            to_encode,
+            batch_size=batch_size,
+            device=device,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        embeddings[missing] = encoded
+        if use_cache:
+            embedding_cache.put_many(to_encode, encoded)
+
+    return np.ascontiguousarray(embeddings, dtype="float32"), len(missing)
+
+def embedding_dimension() -> int:
+    return embedding_model.get_sentence_embedding_dimension()
+
+def embedding_tokenizer():
+    """The model's tokenizer and how many content tokens fit its window ([CLS]/[SEP] excluded)."""
+    return embedding_model.tokenizer, embedding_model.max_seq_length - 2
+
+def embed_documents(texts: list[str], batch_size: int = DEFAULT_BATCH_SIZE, use_cache: bool = True, verbose: bool = True) -> np.ndarray:
+    """
+    Compute embeddings for a list of texts in batches.
+
+    Bulk corpora bypass the in-process query cache: texts are looked up in the
+    on-disk embedding cache, only the misses are handed to the model
+    `batch_size` at a time, and the result is a single contiguous float32
+    matrix of shape (len(texts), dim). `verbose=False` skips the throughput
+    line, for callers that embed many small batches and report their own.
+    """
+    dim = embedding_model.get_sentence_embedding_dimension()
+    if not texts:
+        return np.empty((0, dim), dtype="float32")
+
+    start = time.perf_counter()
+    embeddings, n_encoded = _embed(texts, batch_size, use_cache)
+    elapsed = time.perf_counter() - start
+
+    if not verbose:
+        return embeddings
+
+    rate = len(texts) / elapsed if elapsed > 0 else float("inf")
+    print(
+        f"[DEBUG] Embedded {len(texts)} chunks in {elapsed:.2f}s ({rate:.1f} chunks/sec, batch_size={batch_size}); "
+        f"cache hits: {len(texts) - n_encoded}, encoded: {n_encoded}"
+    )
+
+    return embeddings
 
-def embed_documents(texts: list[str]) -> list[np.ndarray]:
-    """Compute embeddings for a list of texts."""
-    return [np.array(get_cached_embedding(text)) for text in texts]
+def embed_queries(queries: list[str]) -> np.ndarray:
+    """
+    Embed a handful of queries with at most one model call; returns a (len(queries), dim) matrix.
+    Recently seen queries come from memory; nothing is written to the on-disk chunk cache.
+    """
+    dim = embedding_model.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(queries), dim), dtype="float32")
+    missing = []
+    for i, vector in enumerate(_recall_queries(queries)):
+        if vector is None:
+            missing.append(i)
+        else:
+            embeddings[i] = vector
+    if missing:
+        to_encode = [queries[i] for i in missing]
+        encoded, _ = _embed(to_encode, DEFAULT_BATCH_SIZE, use_cache=False)
+        embeddings[missing] = encoded
+        _remember_queries(to_encode, encoded)
+    return embeddings
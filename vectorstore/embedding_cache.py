@@ -0,0 +1,132 @@
+# vectorstore/embedding_cache.py
+
+import os
+import hashlib
+import threading
+import numpy as np
+
+KEY_SIZE = 20  # sha1 digest length
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding store.
+
+    Vectors are appended to a raw float32 file that is memory-mapped for reads;
+    a parallel keys file holds the sha1 of (model name, chunk text) for every row.
+    Both files are append-only, so the cache survives restarts and is shared by
+    every index rebuild that uses the same model.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dim: int):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.dim = dim
+
+        slug = model_name.replace("/", "__")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.keys_path = os.path.join(cache_dir, f"{slug}.keys")
+        self.vectors_path = os.path.join(cache_dir, f"{slug}.f32")
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._vectors = None
+        self._load()
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def _load(self):
+        for path in (self.keys_path, self.vectors_path):
+            if not os.path.exists(path):
+                open(path, "wb").close()
+
+        n_keys = os.path.getsize(self.keys_path) // KEY_SIZE
+        n_vectors = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        n_rows = min(n_keys, n_vectors)
+
+        # Drop any torn tail left by an interrupted append
+        if os.path.getsize(self.keys_path) != n_rows * KEY_SIZE:
+            os.truncate(self.keys_path, n_rows * KEY_SIZE)
+        if os.path.getsize(self.vectors_path) != n_rows * 4 * self.dim:
+            os.truncate(self.vectors_path, n_rows * 4 * self.dim)
+
+        with open(self.keys_path, "rb") as f:
+            raw = f.read()
+        self._rows = {raw[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(n_rows)}
+        self._remap()
+
+    def _remap(self, n_rows: int = None):
+        n_rows = len(self._rows) if n_rows is None else n_rows
+        if n_rows == 0:
+            self._vectors = np.empty((0, self.dim), dtype="float32")
+        else:
+            self._vectors = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(n_rows, self.dim))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, text: str):
+        """Return the cached vector for `text`, or None on a miss."""
+        row = self._rows.get(self._key(text))
+        if row is None:
+            return None
+        return np.array(self._vectors[row], dtype="float32")
+
+    def get_many(self, texts: list[str]) -> tuple[np.ndarray, list[int]]:
+        """
+        Look up a batch of texts.
+        Returns a (len(texts), dim) float32 matrix filled for the hits and the
+        positions of the texts that still need to be encoded.
+        """
+        vectors = np.empty((len(texts), self.dim), dtype="float32")
+        hit_positions, hit_rows, missing = [], [], []
+        for i, text in enumerate(texts):
+            row = self._rows.get(self._key(text))
+            if row is None:
+                missing.append(i)
+            else:
+                hit_positions.append(i)
+                hit_rows.append(row)
+
+        if hit_rows:
+            # Rows are published only after the map grows, so this map covers them all
+            stored = self._vectors
+            vectors[hit_positions] = stored[hit_rows]
+        return vectors, missing
+
+    def put_many(self, texts: list[str], vectors: np.ndarray):
+        """Append vectors for texts that are not cached yet."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(len(texts), self.dim)
+
+        with self._lock:
+            new_keys, new_positions = [], []
+            seen = set()
+            for i, text in enumerate(texts):
+                key = self._key(text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_positions.append(i)
+
+            if not new_keys:
+                return
+
+            # Vectors go first so a key never points past the end of the vector file
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors[new_positions].tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+
+            start = len(self._rows)
+            self._remap(start + len(new_keys))
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+
+
+# from vectorstore.embedding_cache import EmbeddingCache
+
+# cache = EmbeddingCache("embedding_cache", "all-MiniLM-L6-v2", dim=384)
+# vectors, missing = cache.get_many(["chunk one", "chunk two"])
+# print(f"{len(missing)} texts need encoding")
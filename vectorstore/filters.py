@@ -0,0 +1,155 @@
+# vectorstore/filters.py
+
+import numpy as np
+from datetime import datetime
+
+# Source subtrees (relative to the data folder) and the classifier category their chunks are tagged with.
+# The first matching prefix wins; anything else is tagged "general".
+SOURCE_CATEGORIES = [
+    ("arista/products", "product"),
+    ("products_data", "product"),
+    ("arista/support/software", "feature"),
+    ("arista/tech", "feature"),
+    ("arista/solutions", "feature"),
+    ("arista/support", "legal"),
+    ("support_data", "legal"),
+    ("arista/news", "news"),
+    ("arista/advisories", "news"),
+    ("arista/partner", "collaboration"),
+]
+
+MAX_CACHED_MASKS = 64
+
+
+def category_for_source(source: str) -> str:
+    source = source.replace("\\", "/")
+    for prefix, category in SOURCE_CATEGORIES:
+        if source.startswith(prefix):
+            return category
+    return "general"
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _as_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class MetadataFilter:
+    """
+    Predicate over chunk metadata. Every given field must match; list values match any element.
+
+    Args:
+        source_prefix: Path prefix(es) of `source`, relative to the data folder.
+        file_type: File extension(s), e.g. ".txt".
+        category: Category tag(s) assigned at index time (see SOURCE_CATEGORIES).
+        modified_after / modified_before: datetime, ISO string or UNIX timestamp
+            bounds on `file_modified_time`.
+    """
+
+    def __init__(self, source_prefix=None, file_type=None, category=None, modified_after=None, modified_before=None):
+        self.source_prefix = _as_list(source_prefix)
+        self.file_type = _as_list(file_type)
+        self.category = _as_list(category)
+        self.modified_after = _as_timestamp(modified_after)
+        self.modified_before = _as_timestamp(modified_before)
+
+    def key(self):
+        return (
+            tuple(self.source_prefix or ()),
+            tuple(self.file_type or ()),
+            tuple(self.category or ()),
+            self.modified_after,
+            self.modified_before
+        )
+
+    def __repr__(self):
+        return f"MetadataFilter{self.key()}"
+
+
+class FilterColumns:
+    """
+    Dictionary-encoded metadata columns for evaluating filters as chunk-ID bitmaps.
+
+    Predicates are evaluated once per distinct source file, then broadcast to
+    chunks through the source-code column, and the resulting masks are cached.
+    """
+
+    def __init__(self, source_codes: np.ndarray, source_records: list[dict]):
+        """
+        Args:
+            source_codes: Per-chunk index into `source_records` (-1 for removed chunks).
+            source_records: Per-file dicts with source, file_type, category, file_modified_time.
+        """
+        self.source_codes = np.asarray(source_codes, dtype="int32")
+        self.sources = [record["source"] for record in source_records]
+        self.file_types = np.array([record.get("file_type") or "" for record in source_records], dtype=object)
+        self.categories = np.array(
+            [record.get("category") or category_for_source(record["source"]) for record in source_records],
+            dtype=object
+        )
+        self.mtimes = np.array([_as_timestamp(record["file_modified_time"]) for record in source_records], dtype="float64")
+        self._masks = {}
+
+    @classmethod
+    def from_metadatas(cls, metadatas):
+        """Build the columns from per-chunk metadata dicts (legacy pickle stores)."""
+        source_index, records = {}, []
+        source_codes = np.full(len(metadatas), -1, dtype="int32")
+        for chunk_id, meta in enumerate(metadatas):
+            if meta is None:
+                continue
+            code = source_index.get(meta["source"])
+            if code is None:
+                code = source_index[meta["source"]] = len(records)
+                records.append(meta)
+            source_codes[chunk_id] = code
+        return cls(source_codes, records)
+
+    def select(self, flt: MetadataFilter) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return (mask, bitmap) for the chunks matching `flt`: a boolean mask over
+        chunk IDs and the same selection packed in the little-endian bit layout
+        of faiss.IDSelectorBitmap.
+        """
+        key = flt.key()
+        cached = self._masks.get(key)
+        if cached is not None:
+            return cached
+
+        ok = np.ones(len(self.sources), dtype=bool)
+        if flt.source_prefix:
+            ok &= np.array([source.startswith(tuple(flt.source_prefix)) for source in self.sources], dtype=bool)
+        if flt.file_type:
+            ok &= np.isin(self.file_types, flt.file_type)
+        if flt.category:
+            ok &= np.isin(self.categories, flt.category)
+        if flt.modified_after is not None:
+            ok &= self.mtimes >= flt.modified_after
+        if flt.modified_before is not None:
+            ok &= self.mtimes <= flt.modified_before
+
+        live = self.source_codes >= 0
+        mask = np.zeros(len(self.source_codes), dtype=bool)
+        mask[live] = ok[self.source_codes[live]]
+
+        if len(self._masks) >= MAX_CACHED_MASKS:
+            self._masks.pop(next(iter(self._masks)))
+        self._masks[key] = (mask, np.packbits(mask, bitorder="little"))
+        return self._masks[key]
+
+
+# from vectorstore.filters import MetadataFilter
+
+# legal_only = MetadataFilter(category="legal", modified_after="2024-01-01")
+# hits = retriever.hybrid_search([query], filters=legal_only)
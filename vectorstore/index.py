@@ -1,68 +1,664 @@
 # vectorstore/index.py
 
 import os
-import pickle
+import time
+import queue
+import inspect
 import shutil
+import threading
 import numpy as np
 import faiss
 import tqdm
 from datetime import datetime
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from concurrent.futures import ThreadPoolExecutor
 
-from vectorstore.embedding import embed_documents
+from vectorstore.embedding import embed_documents, embedding_dimension, embedding_tokenizer
+from vectorstore.chunker import TextChunker
+from vectorstore.dedup import minhash, NearDuplicateIndex
+from vectorstore.ingest import (
+    DEFAULT_INGEST_WORKERS, iter_text_files, hash_text, read_text, chunk_file, file_entry, start_pool, ingest_files
+)
+from vectorstore.artifacts import artifact_path, load_json, save_json, append_vectors, clear_vectors, load_vectors
+from vectorstore.ann import (
+    default_params, create_index, train_index, apply_search_params, needs_training, prepare_vectors, normalize
+)
+from vectorstore.lexical import BM25Index
+from vectorstore.metadata_store import MetadataStore, TEXT_FILE
+from vectorstore.versions import IndexVersions, INDEX_FILE, METADATA_DIR
 
-def build_index(main_data_folder: str, index_path: str, metadata_path: str, drive_backup_dir: str):
-    documents, metadatas = [], []
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=64)
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 64
 
-    for root, _, files in os.walk(main_data_folder):
-        for file in files:
-            if file.endswith(".txt"):
-                file_path = os.path.join(root, file)
-                modified_time = datetime.fromtimestamp(os.stat(file_path).st_mtime).isoformat()
+# Streaming build: chunks embedded and written per step, and how many steps/files may wait between stages
+STREAM_BATCH_CHUNKS = 1024
+STREAM_QUEUE_FILES = 64
+STREAM_QUEUE_BATCHES = 4
+PROGRESS_INTERVAL = 10.0
 
-                with open(file_path, "r", encoding="utf-8") as f:
-                    full_text = f.read()
 
-                chunks = text_splitter.split_text(full_text)
+def _make_chunker(chunk_tokens: int = None) -> TextChunker:
+    """
+    Character chunks of CHUNK_SIZE by default. With `chunk_tokens`, chunks are
+    measured with the embedding model's tokenizer and capped at its window, so
+    the model never truncates them; the overlap keeps the same proportion.
+    """
+    if not chunk_tokens:
+        return TextChunker(CHUNK_SIZE, CHUNK_OVERLAP)
+    tokenizer, window = embedding_tokenizer()
+    chunk_tokens = min(chunk_tokens, window)
+    return TextChunker(chunk_tokens, chunk_tokens * CHUNK_OVERLAP // CHUNK_SIZE, tokenizer=tokenizer)
 
-                for idx, chunk in enumerate(chunks):
-                    documents.append(chunk)
-                    metadatas.append({
-                        "source": os.path.relpath(file_path, main_data_folder),
-                        "filename": os.path.basename(file_path),
-                        "file_modified_time": modified_time,
-                        "chunk_index": idx,
-                        "total_chunks": len(chunks),
-                        "chunk_char_start": full_text.find(chunk),
-                        "chunk_char_end": full_text.find(chunk) + len(chunk),
-                        "file_type": ".txt",
-                        "content_preview": chunk[:50] + ("..." if len(chunk) > 50 else "")
-                    })
 
-    print(f"[DEBUG] Encoding {len(documents)} document chunks...")
-    embeddings = embed_documents(documents)
+def _collapse_duplicates(chunks, metadatas, signatures, dedup, next_id):
+    """
+    Split one file's chunks into canonical chunks, which get IDs from `next_id`
+    on and join `dedup`, and near-duplicates of chunks already in `dedup`,
+    returned as (canonical_id, metadata) pairs. Without `dedup` every chunk is
+    canonical. Returns (chunks, metadatas, duplicates).
+    """
+    if dedup is None:
+        for offset, meta in enumerate(metadatas):
+            meta["chunk_id"] = next_id + offset
+        return chunks, metadatas, []
 
-    index = faiss.IndexFlatL2(embeddings[0].shape[0])
-    index.add(np.array(embeddings).astype("float32"))
+    kept_chunks, kept_metas, duplicates = [], [], []
+    for chunk, meta, signature in zip(chunks, metadatas, signatures):
+        canonical_id = dedup.find(signature)
+        if canonical_id is not None:
+            duplicates.append((canonical_id, meta))
+            continue
+        meta["chunk_id"] = next_id + len(kept_chunks)
+        dedup.add(meta["chunk_id"], signature)
+        kept_chunks.append(chunk)
+        kept_metas.append(meta)
+    return kept_chunks, kept_metas, duplicates
 
-    faiss.write_index(index, index_path)
-    with open(metadata_path, "wb") as f:
-        pickle.dump({"documents": documents, "metadatas": metadatas}, f)
+
+def _file_record(entry: dict, start_id: int, n_chunks: int, duplicates: list) -> dict:
+    """Manifest entry of a file: its own chunk ID range plus the chunks its near-duplicates were collapsed into."""
+    record = dict(entry, ids=[start_id, start_id + n_chunks])
+    if duplicates:
+        record["duplicate_of"] = sorted({canonical_id for canonical_id, _ in duplicates})
+    return record
+
+
+def _add_file(file_path, full_text, main_data_folder, chunker, documents, metadatas, duplicates, manifest, dedup=None, first_id=0):
+    """
+    Chunk a file, append its chunks to `documents`/`metadatas` (and collapsed
+    near-duplicates to `duplicates` when `dedup` is given) and record their IDs
+    in the manifest. IDs continue from `first_id + len(documents)`.
+    """
+    chunks, chunk_metas = chunk_file(file_path, full_text, main_data_folder, chunker)
+    signatures = [minhash(chunk) for chunk in chunks] if dedup is not None else None
+    start_id = first_id + len(documents)
+    chunks, chunk_metas, file_duplicates = _collapse_duplicates(chunks, chunk_metas, signatures, dedup, start_id)
+    documents.extend(chunks)
+    metadatas.extend(chunk_metas)
+    duplicates.extend(file_duplicates)
+
+    rel_path = os.path.relpath(file_path, main_data_folder)
+    manifest["files"][rel_path] = _file_record(file_entry(file_path, full_text), start_id, len(chunks), file_duplicates)
+
+
+def _save_index(index, bm25, manifest, params, index_path, metadata_path, drive_backup_dir, dedup=None):
+    # Replaced rather than rewritten, so an index file shared with another version stays intact
+    faiss.write_index(index, f"{index_path}.tmp")
+    os.replace(f"{index_path}.tmp", index_path)
+    bm25_path = artifact_path(index_path, "bm25.npz")
+    bm25.save(bm25_path)
+    manifest_path = artifact_path(index_path, "manifest.json")
+    params_path = artifact_path(index_path, "params.json")
+    vectors_path = artifact_path(index_path, "vectors.f32")
+    save_json(manifest_path, manifest)
+    save_json(params_path, params)
+    paths = [index_path, manifest_path, params_path, vectors_path, bm25_path]
+    if dedup is not None:
+        paths.append(artifact_path(index_path, "minhash.npz"))
+        dedup.save(paths[-1])
 
     # Ensure backup directory exists
     os.makedirs(drive_backup_dir, exist_ok=True)
 
-    shutil.copy(index_path, os.path.join(drive_backup_dir, os.path.basename(index_path)))
-    shutil.copy(metadata_path, os.path.join(drive_backup_dir, os.path.basename(metadata_path)))
+    for path in paths:
+        shutil.copy(path, os.path.join(drive_backup_dir, os.path.basename(path)))
+    shutil.copytree(metadata_path, os.path.join(drive_backup_dir, os.path.basename(metadata_path)), dirs_exist_ok=True)
+
+
+class _StageMeter:
+    """Item count and busy time of one pipeline stage, for progress and throughput reporting."""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.busy = 0.0
+
+    def record(self, count: int, seconds: float):
+        self.count += count
+        self.busy += seconds
+
+    def __str__(self):
+        rate = self.count / self.busy if self.busy > 0 else 0.0
+        return f"{self.name}: {self.count} {self.unit} ({rate:.1f}/s busy)"
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once another stage has failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Blocking get; returns None (end of stream) once another stage has failed."""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _stage(fn, stop: threading.Event):
+    """Wrap a pipeline stage so a failure stops the other stages instead of deadlocking them."""
+    def run(*args):
+        try:
+            return fn(*args)
+        except BaseException:
+            stop.set()
+            raise
+    return run
+
+
+class _IndexWriter:
+    """
+    Final stage of the streaming build: appends embedded batches to the vectors
+    file, BM25 postings, metadata store and FAISS index.
+
+    Index types without training get vectors added batch by batch. Trained types
+    (IVF, PQ, SQ8) spill index-ready vectors to a scratch file instead; once the
+    stream ends they are sized from the real corpus, trained on a random sample
+    of the memory-mapped spill and filled from it in slices, so memory stays
+    bounded by the training sample rather than the corpus.
+    """
+
+    def __init__(self, index_type: str, metric: str, search_params: dict, dim: int, index_path: str, store: MetadataStore):
+        self.index_type = index_type
+        self.metric = metric
+        self.search_params = search_params or {}
+        self.dim = dim
+        self.store = store
+        self.bm25 = BM25Index()
+        self.n_chunks = 0
+        self.vectors_path = artifact_path(index_path, "vectors.f32")
+        self.spill_path = artifact_path(index_path, "build.f32") if needs_training(index_type) else None
+        for path in (f"{self.vectors_path}.tmp", self.spill_path):
+            if path:
+                open(path, "wb").close()
 
+        self.index = None
+        if self.spill_path is None:
+            self.params = self._params(0)
+            self.index = create_index(dim, self.params)
+
+    def _params(self, n_vectors: int) -> dict:
+        params = default_params(self.index_type, n_vectors, self.dim, self.metric)
+        params.update(self.search_params)
+        return params
+
+    def write(self, start_id: int, documents: list[str], metadatas: list[dict], duplicates: list, embeddings: np.ndarray):
+        self.store.add_duplicates(duplicates)
+        if not documents:
+            return
+        ids = np.arange(start_id, start_id + len(documents), dtype="int64")
+        append_vectors(f"{self.vectors_path}.tmp", normalize(embeddings))
+        self.bm25.extend(ids, documents)
+        self.store.append(documents, metadatas)
+        if self.index is not None:
+            self.index.add_with_ids(prepare_vectors(embeddings, self.params), ids)
+        else:
+            append_vectors(self.spill_path, prepare_vectors(embeddings, self._params(0)))
+        self.n_chunks += len(documents)
+
+    def close(self):
+        """Finish every artifact; returns (index, bm25, params)."""
+        os.replace(f"{self.vectors_path}.tmp", self.vectors_path)
+        self.bm25.commit()
+        self.store.flush()
+
+        if self.index is None:
+            self.params = self._params(self.n_chunks)
+            self.index = create_index(self.dim, self.params)
+            spilled = load_vectors(self.spill_path, self.dim)
+            train_index(self.index, spilled)
+            for start in range(0, len(spilled), STREAM_BATCH_CHUNKS):
+                end = min(start + STREAM_BATCH_CHUNKS, len(spilled))
+                self.index.add_with_ids(np.ascontiguousarray(spilled[start:end]), np.arange(start, end, dtype="int64"))
+            del spilled
+            os.remove(self.spill_path)
+
+        apply_search_params(self.index, self.params)
+        return self.index, self.bm25, self.params
+
+
+def build_index(
+    main_data_folder: str,
+    index_path: str,
+    metadata_path: str,
+    drive_backup_dir: str,
+    batch_size: int = 64,
+    index_type: str = "flat",
+    search_params: dict = None,
+    metric: str = "l2",
+    chunk_tokens: int = None,
+    workers: int = None,
+    subtree: str = None,
+    dedup: bool = True
+):
+    """
+    Build a fresh index over every .txt file in the data folder.
+
+    `index_type` selects exact search ("flat") or an approximate index
+    ("ivf_flat", "ivf_pq", "hnsw", "sq8"); approximate indexes are trained on a
+    sample of the corpus. `search_params` overrides the defaults (e.g. nlist,
+    nprobe, efSearch) and is persisted next to the index so FAISSRetriever
+    applies it on load. `metric="cosine"` stores L2-normalized vectors in an
+    inner-product index, so search scores are cosine similarities.
+
+    Chunk texts and metadata go to a columnar MetadataStore directory at
+    `metadata_path`. `chunk_tokens` switches chunking from CHUNK_SIZE characters
+    to that many embedding-model tokens; the choice is kept in the manifest so
+    incremental updates chunk new files the same way.
+
+    The build is a streaming pipeline with bounded queues between the stages:
+    a reader thread feeds files to `workers` processes that read and chunk them
+    (DEFAULT_INGEST_WORKERS by default, 1 for in-process) and collects their
+    results in file order, so chunk IDs never depend on the worker count; the
+    calling thread embeds `STREAM_BATCH_CHUNKS` chunks at a time; a writer
+    thread appends each batch to the index, vectors file, BM25 postings and
+    metadata store. Peak memory is a few batches plus per-chunk bookkeeping,
+    independent of corpus size, and per-stage throughput is printed as the
+    build runs.
+
+    `subtree` (e.g. "arista/support") restricts the build to one directory of
+    the data folder, for shards; sources stay relative to the data folder.
+
+    With `dedup`, near-duplicate chunks (repeated page boilerplate, re-wrapped
+    copies) are collapsed at read time: every chunk gets a MinHash signature in
+    the ingest workers, and a chunk whose estimated Jaccard similarity to an
+    already indexed chunk reaches JACCARD_THRESHOLD gets no vector of its own.
+    Its location is recorded on the kept chunk instead and surfaces as
+    metadata["duplicate_locations"]. The signatures are saved next to the
+    index (minhash.npz) so incremental updates keep collapsing.
+    """
+    manifest = {"files": {}, "chunk_tokens": chunk_tokens, "subtree": subtree, "dedup": dedup}
+    dedup_index = NearDuplicateIndex() if dedup else None
+    n_duplicates = 0
+    chunker = _make_chunker(chunk_tokens)
+    store = MetadataStore.create(metadata_path)
+    writer = _IndexWriter(index_type, metric, search_params, embedding_dimension(), index_path, store)
+
+    files_queue = queue.Queue(maxsize=STREAM_QUEUE_FILES)
+    batches_queue = queue.Queue(maxsize=STREAM_QUEUE_BATCHES)
+    stop = threading.Event()
+    read_meter = _StageMeter("read+chunk", "files")
+    embed_meter = _StageMeter("embed", "chunks")
+    write_meter = _StageMeter("write", "chunks")
+
+    def read_files():
+        nonlocal n_duplicates
+        next_id = 0
+        results = ingest_files(file_paths, main_data_folder, chunker, ingest_pool, workers, signatures=dedup)
+        while True:
+            start = time.perf_counter()
+            result = next(results, None)
+            if result is None:
+                break
+            rel_path, chunks, metadatas, entry, signatures = result
+            chunks, metadatas, duplicates = _collapse_duplicates(chunks, metadatas, signatures, dedup_index, next_id)
+            manifest["files"][rel_path] = _file_record(entry, next_id, len(chunks), duplicates)
+            next_id += len(chunks)
+            n_duplicates += len(duplicates)
+            read_meter.record(1, time.perf_counter() - start)
+            if (chunks or duplicates) and not _put(files_queue, (chunks, metadatas, duplicates), stop):
+                return
+        _put(files_queue, None, stop)
+
+    def write_batches():
+        while True:
+            batch = _get(batches_queue, stop)
+            if batch is None:
+                return
+            start = time.perf_counter()
+            writer.write(*batch)
+            write_meter.record(len(batch[1]), time.perf_counter() - start)
+
+    def embed(documents, metadatas, duplicates, start_id):
+        start = time.perf_counter()
+        embeddings = embed_documents(documents, batch_size=batch_size, verbose=False) if documents else None
+        embed_meter.record(len(documents), time.perf_counter() - start)
+        return _put(batches_queue, (start_id, documents, metadatas, duplicates, embeddings), stop)
+
+    build_start = last_report = time.perf_counter()
+    workers = DEFAULT_INGEST_WORKERS if workers is None else workers
+    file_paths = list(iter_text_files(main_data_folder, subtree))
+    ingest_pool = start_pool(workers, chunker)
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="index-build") as pool:
+        reader = pool.submit(_stage(read_files, stop))
+        writer_future = pool.submit(_stage(write_batches, stop))
+        try:
+            documents, metadatas, duplicates, next_id = [], [], [], 0
+            while True:
+                item = _get(files_queue, stop)
+                if item is not None:
+                    documents.extend(item[0])
+                    metadatas.extend(item[1])
+                    duplicates.extend(item[2])
+                if (documents or duplicates) and (item is None or len(documents) >= STREAM_BATCH_CHUNKS):
+                    if not embed(documents, metadatas, duplicates, next_id):
+                        break
+                    next_id += len(documents)
+                    documents, metadatas, duplicates = [], [], []
+                if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.perf_counter()
+                    print(
+                        f"[DEBUG] Build progress | {read_meter} | {embed_meter} | {write_meter} | "
+                        f"queued: {files_queue.qsize()} files, {batches_queue.qsize()} batches"
+                    )
+                if item is None:
+                    break
+            _put(batches_queue, None, stop)
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            if ingest_pool is not None:
+                ingest_pool.shutdown(cancel_futures=True)
+        reader.result()
+        writer_future.result()
+
+    index, bm25, params = writer.close()
+    _save_index(index, bm25, manifest, params, index_path, metadata_path, drive_backup_dir, dedup_index)
+
+    elapsed = time.perf_counter() - build_start
+    rate = writer.n_chunks / elapsed if elapsed > 0 else float("inf")
+    print(f"[DEBUG] Indexed {writer.n_chunks} chunks from {read_meter.count} files in {elapsed:.2f}s ({rate:.1f} chunks/sec)")
+    if dedup:
+        total = writer.n_chunks + n_duplicates
+        print(f"[DEBUG] Collapsed {n_duplicates} near-duplicate chunks ({100 * n_duplicates / max(total, 1):.1f}% of {total})")
+    print(f"[DEBUG] Stage throughput | {read_meter} | {embed_meter} | {write_meter}")
     print("[DEBUG] FAISS index and metadata saved successfully.")
 
-# from vectorstore.index import build_index
+
+def update_index(main_data_folder: str, index_path: str, metadata_path: str, drive_backup_dir: str, batch_size: int = 64, subtree: str = None):
+    """
+    Bring an existing index up to date with the data folder.
+
+    Files are compared against the manifest by mtime and size (and content hash
+    when those differ); only new or changed files are re-chunked and embedded,
+    vectors of changed or deleted files are removed by ID, and the metadata store
+    is updated in place. Removed chunk IDs are left as tombstones so every other
+    chunk keeps its ID. Falls back to a full build when no usable index exists.
+    `subtree` limits the update to one shard's directory (see update_shards).
+
+    On a deduplicated index, new chunks are collapsed against the saved MinHash
+    signatures, and unchanged files whose near-duplicates were collapsed into a
+    removed chunk are re-ingested too, so no location loses its vector.
+
+    Returns whether anything was written.
+    """
+    manifest = load_json(artifact_path(index_path, "manifest.json"))
+    params = load_json(artifact_path(index_path, "params.json"), {"index_type": "flat"})
+    index_type, metric = params["index_type"], params.get("metric", "l2")
+    chunk_tokens = (manifest or {}).get("chunk_tokens")
+    dedup_enabled = (manifest or {}).get("dedup", False)
+    vectors_path = artifact_path(index_path, "vectors.f32")
+    bm25_path = artifact_path(index_path, "bm25.npz")
+    dedup_path = artifact_path(index_path, "minhash.npz")
+    required = (index_path, vectors_path, bm25_path) + ((dedup_path,) if dedup_enabled else ())
+    if manifest is None or not MetadataStore.exists(metadata_path) or not all(os.path.exists(path) for path in required):
+        print("[INFO] Index artifacts incomplete; running a full build.")
+        build_index(main_data_folder, index_path, metadata_path, drive_backup_dir, batch_size, index_type, metric=metric, chunk_tokens=chunk_tokens, subtree=subtree, dedup=dedup_enabled)
+        return True
+
+    index = faiss.read_index(index_path)
+    if not isinstance(index, faiss.IndexIDMap2):
+        print("[INFO] Index does not support ID-based updates; running a full build.")
+        build_index(main_data_folder, index_path, metadata_path, drive_backup_dir, batch_size, index_type, metric=metric, chunk_tokens=chunk_tokens, subtree=subtree, dedup=dedup_enabled)
+        return True
+
+    store = MetadataStore(metadata_path)
+    bm25 = BM25Index.load(bm25_path)
+    dedup = NearDuplicateIndex.load(dedup_path) if dedup_enabled else None
+
+    chunker = _make_chunker(chunk_tokens)
+    known_files = manifest["files"]
+    seen, removed_ids, changed = set(), [], {}
+    touched = False
+
+    for file_path in iter_text_files(main_data_folder, subtree):
+        rel_path = os.path.relpath(file_path, main_data_folder)
+        seen.add(rel_path)
+        entry = known_files.get(rel_path)
+        stat = os.stat(file_path)
+
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            continue
+
+        full_text = read_text(file_path)
+        if entry and entry["sha1"] == hash_text(full_text):
+            # Touched but unchanged: refresh the recorded timestamps only
+            entry["mtime"] = stat.st_mtime
+            store.set_file_modified_time(rel_path, datetime.fromtimestamp(stat.st_mtime).isoformat())
+            touched = True
+            continue
+
+        if entry:
+            removed_ids.extend(range(*entry["ids"]))
+        changed[rel_path] = (file_path, full_text)
+
+    deleted = [path for path in known_files if path not in seen]
+    for rel_path in deleted:
+        removed_ids.extend(range(*known_files.pop(rel_path)["ids"]))
+
+    # Files with near-duplicates of removed chunks are re-ingested, which removes their own chunks in turn
+    orphaned = set(removed_ids)
+    while dedup is not None and orphaned:
+        referencing = [
+            path for path, entry in known_files.items()
+            if path not in changed and orphaned.intersection(entry.get("duplicate_of", ()))
+        ]
+        orphaned = set()
+        for rel_path in referencing:
+            file_path = os.path.join(main_data_folder, rel_path)
+            changed[rel_path] = (file_path, read_text(file_path))
+            orphaned.update(range(*known_files[rel_path]["ids"]))
+        removed_ids.extend(orphaned)
+
+    if not changed and not removed_ids:
+        if touched:
+            store.flush()
+            _save_index(index, bm25, manifest, params, index_path, metadata_path, drive_backup_dir, dedup)
+        print("[INFO] FAISS index is up to date.")
+        return touched
+
+    if dedup is not None:
+        dedup.remove(removed_ids)
+    store.drop_duplicate_locations(list(changed) + deleted)
+    documents, metadatas, duplicates = [], [], []
+    first_new_id = len(store)
+    for rel_path in sorted(changed):
+        file_path, full_text = changed[rel_path]
+        _add_file(file_path, full_text, main_data_folder, chunker, documents, metadatas, duplicates, manifest, dedup, first_new_id)
+    new_ids = np.arange(first_new_id, first_new_id + len(documents), dtype="int64")
+
+    if removed_ids:
+        try:
+            index.remove_ids(np.array(removed_ids, dtype="int64"))
+        except RuntimeError:
+            # e.g. HNSW graphs cannot delete vectors
+            print(f"[INFO] '{index_type}' index does not support removals; running a full build.")
+            build_index(main_data_folder, index_path, metadata_path, drive_backup_dir, batch_size, index_type, params, metric, chunk_tokens, subtree=subtree, dedup=dedup_enabled)
+            return True
+        store.delete(removed_ids)
+        clear_vectors(vectors_path, removed_ids, params["dim"])
+        bm25.remove(removed_ids)
+
+    if len(new_ids):
+        print(f"[DEBUG] Encoding {len(new_ids)} new document chunks...")
+        embeddings = embed_documents(documents, batch_size=batch_size)
+        index.add_with_ids(prepare_vectors(embeddings, params), new_ids)
+        append_vectors(vectors_path, normalize(embeddings))
+        bm25.add(new_ids, documents)
+        store.append(documents, metadatas)
+    store.add_duplicates(duplicates)
+
+    store.flush()
+    _save_index(index, bm25, manifest, params, index_path, metadata_path, drive_backup_dir, dedup)
+
+    print(f"[DEBUG] FAISS index updated: {len(new_ids)} chunks added, {len(removed_ids)} removed, {len(duplicates)} near-duplicates collapsed.")
+    return True
+
+def data_changed(main_data_folder: str, index_path: str, subtree: str = None) -> bool:
+    """Whether any .txt file was added, deleted, or modified (by mtime or size) since the index's manifest was written."""
+    manifest = load_json(artifact_path(index_path, "manifest.json"))
+    if manifest is None:
+        return True
+    known_files = manifest["files"]
+    n_seen = 0
+    for file_path in iter_text_files(main_data_folder, subtree):
+        entry = known_files.get(os.path.relpath(file_path, main_data_folder))
+        stat = os.stat(file_path)
+        if not entry or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            return True
+        n_seen += 1
+    return n_seen != len(known_files)
+
+def changed_build_settings(index_path: str, **build_kwargs) -> list[str]:
+    """
+    Names of the build_index settings in `build_kwargs` (defaults included)
+    that differ from the ones the index at `index_path` was built with, as
+    recorded in its params.json and manifest. update_index keeps the recorded
+    ones, so any difference needs a full build.
+    """
+    defaults = {name: parameter.default for name, parameter in inspect.signature(build_index).parameters.items()}
+    params = load_json(artifact_path(index_path, "params.json"), {"index_type": "flat"})
+    manifest = load_json(artifact_path(index_path, "manifest.json"), {})
+    built = {
+        "index_type": params["index_type"],
+        "metric": params.get("metric", "l2"),
+        "chunk_tokens": manifest.get("chunk_tokens"),
+        "dedup": manifest.get("dedup", False)
+    }
+    changed = [name for name, value in built.items() if build_kwargs.get(name, defaults[name]) != value]
+    search_params = build_kwargs.get("search_params") or {}
+    changed.extend(name for name, value in search_params.items() if params.get(name) != value)
+    return changed
+
+# Version files update_index appends to or patches in place; all others are only ever replaced
+IN_PLACE_FILES = (os.path.basename(artifact_path(INDEX_FILE, "vectors.f32")), os.path.join(METADATA_DIR, TEXT_FILE))
+
+def publish_index(main_data_folder: str, index_root: str, drive_backup_dir: str, subtree: str = None, **build_kwargs) -> str:
+    """
+    Build or update the index as a new version under `index_root` and publish it.
+
+    When `build_kwargs` ask for other build settings (index type, metric,
+    chunking, dedup, search params) than the current version was built with,
+    the new version is built from scratch with them. Otherwise the data folder
+    is checked against the current version's manifest; unchanged data creates
+    and publishes nothing, and changed data is applied incrementally to a new
+    version that starts from the current one (hard links, plus private copies
+    of IN_PLACE_FILES). CURRENT is then swapped atomically, so a running
+    FAISSRetriever(index_root=...) can hot-reload it while queries keep using
+    the old version. Returns the current version name.
+    """
+    versions = IndexVersions(index_root)
+    current = versions.current()
+    rebuild = current is None
+    if current is not None:
+        changed_settings = changed_build_settings(versions.index_path(current), **build_kwargs)
+        if changed_settings:
+            print(f"[INFO] Build settings changed ({', '.join(changed_settings)}); rebuilding the index.")
+            rebuild = True
+        elif not data_changed(main_data_folder, versions.index_path(current), subtree):
+            print("[INFO] FAISS index is up to date.")
+            return current
+    version = versions.new_version(base=None if rebuild else current, copy=IN_PLACE_FILES)
+    index_path, metadata_path = versions.index_path(version), versions.metadata_path(version)
+    try:
+        if rebuild:
+            build_index(main_data_folder, index_path, metadata_path, drive_backup_dir, subtree=subtree, **build_kwargs)
+            changed = True
+        else:
+            changed = update_index(main_data_folder, index_path, metadata_path, drive_backup_dir, build_kwargs.get("batch_size", 64), subtree)
+    except BaseException:
+        versions.discard(version)
+        raise
+
+    if not changed:
+        versions.discard(version)
+        return current
+    versions.publish(version)
+    versions.prune()
+    print(f"[INFO] Published index version {version} in {index_root}")
+    return version
+
+
+def shard_root(shard_dir: str, subtree: str) -> str:
+    """Versioned index root of the shard holding one source subtree."""
+    return os.path.join(shard_dir, subtree.strip("/\\").replace("/", "_").replace("\\", "_"))
+
+
+def update_shards(main_data_folder: str, shard_dir: str, drive_backup_dir: str, subtrees: list[str], **build_kwargs) -> dict:
+    """
+    Keep one index per source subtree (e.g. "arista/support", "arista/products")
+    under `shard_dir`, so each shard can be rebuilt and loaded on its own. Each
+    shard is a versioned index root published with publish_index, and is backed
+    up to its own directory under `drive_backup_dir` (named like the shard's
+    root), since every shard's artifacts share the same file names. Files
+    outside every subtree are not indexed.
+
+    Returns {subtree: index_root}, the `shards` argument of FAISSRetriever.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = {}
+    for subtree in subtrees:
+        print(f"[INFO] Checking shard '{subtree}'...")
+        shards[subtree] = shard_root(shard_dir, subtree)
+        backup_dir = os.path.join(drive_backup_dir, os.path.basename(shards[subtree]))
+        publish_index(main_data_folder, shards[subtree], backup_dir, subtree=subtree, **build_kwargs)
+    return shards
+
+# from vectorstore.index import build_index, update_index
 
 # build_index(
 #     main_data_folder="data/raw_documents",
 #     index_path="faiss_index.idx",
-#     metadata_path="metadata.pkl",
+#     metadata_path="metadata_store",
+#     drive_backup_dir="/content/drive/MyDrive",
+#     index_type="hnsw"
+# )
+
+# update_index(
+#     main_data_folder="data/raw_documents",
+#     index_path="faiss_index.idx",
+#     metadata_path="metadata_store",
+#     drive_backup_dir="/content/drive/MyDrive"
+# )
+
+# shards = update_shards(
+#     main_data_folder="data/raw_documents",
+#     shard_dir="shards",
+#     drive_backup_dir="/content/drive/MyDrive",
+#     subtrees=["arista/support", "arista/products", "arista/news", "arista/advisories"]
+# )
+
+# publish_index(
+#     main_data_folder="data/raw_documents",
+#     index_root="vector_index",
 #     drive_backup_dir="/content/drive/MyDrive"
 # )
@@ -0,0 +1,208 @@
+# vectorstore/ingest.py
+
+import os
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from vectorstore.chunker import TextChunker, _synthetic_text
+from vectorstore.dedup import minhash
+from vectorstore.filters import category_for_source
+
+# Ingest workers only read, hash and chunk text; they never touch the embedding model or FAISS
+DEFAULT_INGEST_WORKERS = max(1, min(8, (os.cpu_count() or 1) - 1))
+FILES_PER_TASK = 16
+
+_worker_chunker = None
+
+
+def iter_text_files(main_data_folder: str, subtree: str = None):
+    """Yield .txt files under the data folder (or one subtree of it) in a stable order."""
+    for root, dirs, files in os.walk(os.path.join(main_data_folder, subtree) if subtree else main_data_folder):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(".txt"):
+                yield os.path.join(root, file)
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def read_text(file_path: str) -> str:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def chunk_file(file_path: str, full_text: str, main_data_folder: str, chunker: TextChunker):
+    """Split one file into chunks and build their metadata (without chunk IDs)."""
+    modified_time = datetime.fromtimestamp(os.stat(file_path).st_mtime).isoformat()
+    source = os.path.relpath(file_path, main_data_folder)
+    category = category_for_source(source)
+    spans = chunker.split_spans(full_text)
+
+    chunks, metadatas = [], []
+    for idx, (start, end) in enumerate(spans):
+        chunk = full_text[start:end]
+        chunks.append(chunk)
+        metadatas.append({
+            "source": source,
+            "filename": os.path.basename(file_path),
+            "file_modified_time": modified_time,
+            "chunk_index": idx,
+            "total_chunks": len(spans),
+            "chunk_char_start": start,
+            "chunk_char_end": end,
+            "file_type": ".txt",
+            "category": category,
+            "content_preview": chunk[:50] + ("..." if len(chunk) > 50 else "")
+        })
+    return chunks, metadatas
+
+
+def file_entry(file_path: str, full_text: str) -> dict:
+    """Manifest fields used to detect changed files (chunk IDs are added by the caller)."""
+    stat = os.stat(file_path)
+    return {
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha1": hash_text(full_text)
+    }
+
+
+def _init_worker(chunker: TextChunker):
+    global _worker_chunker
+    _worker_chunker = chunker
+
+
+def _ingest_batch(file_paths: list[str], main_data_folder: str, signatures: bool = False, chunker: TextChunker = None) -> list[tuple]:
+    """Read and chunk a group of files; runs in a worker process unless a chunker is passed."""
+    chunker = chunker or _worker_chunker
+    results = []
+    for file_path in file_paths:
+        full_text = read_text(file_path)
+        chunks, metadatas = chunk_file(file_path, full_text, main_data_folder, chunker)
+        chunk_signatures = [minhash(chunk) for chunk in chunks] if signatures else None
+        results.append((os.path.relpath(file_path, main_data_folder), chunks, metadatas, file_entry(file_path, full_text), chunk_signatures))
+    return results
+
+
+def start_pool(workers: int, chunker: TextChunker):
+    """
+    Process pool for ingest_files, or None for in-process ingestion.
+
+    Workers are forked where the platform allows it. They inherit whatever the
+    caller has loaded (the embedding model included, when called from
+    build_index), but pages are shared copy-on-write and the workers only read
+    and chunk text, so none of it is touched or duplicated. Spawned workers
+    would not start any lighter: they re-import the caller's __main__ module.
+    All workers are started here, before the caller spins up any threads, so
+    forking never copies a process with other threads mid-flight.
+    """
+    if workers <= 1:
+        return None
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(chunker,))
+    for future in [pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+def ingest_files(file_paths: list[str], main_data_folder: str, chunker: TextChunker, pool=None, workers: int = 1, signatures: bool = False):
+    """
+    Yield (rel_path, chunks, metadatas, file_entry, signatures) for every file,
+    in the order of `file_paths` whatever the number of workers, so chunk IDs
+    assigned by the consumer are deterministic. With `signatures`, each chunk's
+    MinHash signature (for near-duplicate detection) is computed in the workers
+    too; otherwise that field is None.
+
+    Files are handed to the pool FILES_PER_TASK at a time, and at most two tasks
+    per worker are in flight, so results never pile up faster than the
+    consumer takes them.
+    """
+    batches = (file_paths[i:i + FILES_PER_TASK] for i in range(0, len(file_paths), FILES_PER_TASK))
+    if pool is None:
+        for batch in batches:
+            yield from _ingest_batch(batch, main_data_folder, signatures, chunker)
+        return
+
+    pending = deque()
+    for batch in batches:
+        pending.append(pool.submit(_ingest_batch, batch, main_data_folder, signatures))
+        if len(pending) >= 2 * workers:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def benchmark_ingest(main_data_folder: str, worker_counts: list[int], chunker: TextChunker = None) -> list[dict]:
+    """Read+chunk throughput of a data folder for each worker count (embedding excluded)."""
+    chunker = chunker or TextChunker()
+    file_paths = list(iter_text_files(main_data_folder))
+    rows, reference = [], None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        pool = start_pool(workers, chunker)
+        try:
+            digest = [(entry["sha1"], len(chunks)) for _, chunks, _, entry, _ in ingest_files(file_paths, main_data_folder, chunker, pool, workers)]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        elapsed = time.perf_counter() - start
+        reference = reference or digest
+        rows.append({
+            "workers": workers,
+            "seconds": elapsed,
+            "files_per_sec": len(file_paths) / elapsed if elapsed > 0 else float("inf"),
+            "chunks": sum(n for _, n in digest),
+            "same_order": digest == reference
+        })
+    for row in rows:
+        row["speedup"] = rows[0]["seconds"] / row["seconds"] if row["seconds"] > 0 else float("inf")
+    return rows
+
+
+def _write_synthetic_corpus(folder: str, n_files: int, seed: int = 0):
+    subtrees = ["arista/products", "arista/support", "arista/news", "arista/tech", "products_data"]
+    for i in range(n_files):
+        directory = os.path.join(folder, subtrees[i % len(subtrees)], f"part{i // 500}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"doc{i:06d}.txt"), "w", encoding="utf-8") as f:
+            f.write(_synthetic_text(0.002 + 0.03 * ((i * 7919) % 100) / 100, seed=seed + i))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-process read+chunk ingestion.")
+    parser.add_argument("--data", help="data folder to ingest (default: a synthetic corpus)")
+    parser.add_argument("--files", type=int, default=5000, help="number of synthetic .txt files")
+    parser.add_argument("--workers", type=int, nargs="+", help="worker counts to compare (default: 1, 2, 4, ... up to the core count)")
+    args = parser.parse_args()
+
+    worker_counts = args.workers or [n for n in (1, 2, 4, 8, 16) if n <= max(os.cpu_count() or 1, 1)]
+    folder = args.data or tempfile.mkdtemp(prefix="ingest_bench_")
+    try:
+        if not args.data:
+            print(f"[INFO] Writing {args.files} synthetic files to {folder}...")
+            _write_synthetic_corpus(folder, args.files)
+        print(f"{'workers':>8}{'seconds':>10}{'files/s':>10}{'speedup':>9}{'chunks':>10}{'same order':>12}")
+        for row in benchmark_ingest(folder, worker_counts):
+            print(
+                f"{row['workers']:>8}{row['seconds']:>10.2f}{row['files_per_sec']:>10.1f}{row['speedup']:>8.2f}x"
+                f"{row['chunks']:>10}{str(row['same_order']):>12}"
+            )
+    finally:
+        if not args.data:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
+
+# python -m vectorstore.ingest --files 5000 --workers 1 2 4 8
@@ -0,0 +1,201 @@
+# vectorstore/lexical.py
+
+import os
+import re
+import numpy as np
+from collections import Counter
+
+# Keeps SKU names (7050x3, 7280sr) and dotted versions (4.32.1f) as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its of on or our
+that the their this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk IDs with compact, array-backed postings.
+
+    Postings are kept in CSR form: `offsets[t]:offsets[t + 1]` slices `doc_ids`
+    and `tfs` for term `t`. Adding or removing chunks only tokenizes the new
+    chunks and re-sorts the integer posting arrays, so incremental index updates
+    stay cheap.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+        self.offsets = np.zeros(1, dtype="int64")
+        self.doc_ids = np.empty(0, dtype="int32")
+        self.tfs = np.empty(0, dtype="uint16")
+        self.doc_lengths = np.empty(0, dtype="float32")
+        self._pending = []
+        self._size = 0
+        self._finalize()
+
+    def __len__(self):
+        return int(np.count_nonzero(self.doc_lengths))
+
+    def add(self, chunk_ids, texts):
+        """Index texts under the given chunk IDs."""
+        self.extend(chunk_ids, texts)
+        self.commit()
+
+    def extend(self, chunk_ids, texts):
+        """
+        Tokenize texts into pending postings without re-sorting the index.
+        Call commit() once after a series of extend() calls (e.g. a streaming build).
+        """
+        term_col, doc_col, tf_col = [], [], []
+        chunk_ids = list(chunk_ids)
+        self._reserve(int(max(chunk_ids, default=-1)) + 1)
+
+        for chunk_id, text in zip(chunk_ids, texts):
+            tokens = tokenize(text)
+            self.doc_lengths[chunk_id] = max(len(tokens), 1)
+            for term, count in Counter(tokens).items():
+                term_col.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_col.append(chunk_id)
+                tf_col.append(min(count, 65535))
+
+        self._pending.append((
+            np.array(term_col, dtype="int64"),
+            np.array(doc_col, dtype="int32"),
+            np.array(tf_col, dtype="uint16")
+        ))
+        self._size = max(self._size, max(chunk_ids, default=-1) + 1)
+
+    def commit(self):
+        """Merge pending postings into the CSR arrays."""
+        if not self._pending:
+            return
+        term_ids = np.concatenate([self._term_column()] + [terms for terms, _, _ in self._pending])
+        doc_ids = np.concatenate([self.doc_ids] + [docs for _, docs, _ in self._pending])
+        tfs = np.concatenate([self.tfs] + [tfs for _, _, tfs in self._pending])
+        self._pending = []
+        self.doc_lengths = self.doc_lengths[:self._size]
+        self._set_postings(term_ids, doc_ids, tfs)
+
+    def _reserve(self, size: int):
+        """Grow doc_lengths geometrically so streaming extend() calls stay amortized O(1)."""
+        if size > len(self.doc_lengths):
+            grown = np.zeros(max(size, 2 * len(self.doc_lengths)), dtype="float32")
+            grown[:len(self.doc_lengths)] = self.doc_lengths
+            self.doc_lengths = grown
+
+    def remove(self, chunk_ids):
+        """Drop all postings of the given chunk IDs."""
+        chunk_ids = np.asarray(list(chunk_ids), dtype="int32")
+        if len(chunk_ids) == 0:
+            return
+        keep = ~np.isin(self.doc_ids, chunk_ids)
+        self.doc_lengths[chunk_ids[chunk_ids < len(self.doc_lengths)]] = 0
+        self._set_postings(self._term_column()[keep], self.doc_ids[keep], self.tfs[keep])
+
+    def _term_column(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.offsets) - 1, dtype="int64"), np.diff(self.offsets))
+
+    def _set_postings(self, term_ids, doc_ids, tfs):
+        order = np.lexsort((doc_ids, term_ids))
+        self.doc_ids = np.ascontiguousarray(doc_ids[order])
+        self.tfs = np.ascontiguousarray(tfs[order])
+        counts = np.bincount(term_ids, minlength=len(self.vocab))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+        self._finalize()
+
+    def _finalize(self):
+        """Precompute per-term IDF and per-document length normalisation."""
+        live = self.doc_lengths > 0
+        n_docs = int(np.count_nonzero(live))
+        avgdl = float(self.doc_lengths[live].mean()) if n_docs else 1.0
+        df = np.diff(self.offsets).astype("float32")
+        self._idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype("float32")
+        self._norm = (self.k1 * (1 - self.b + self.b * self.doc_lengths / avgdl)).astype("float32")
+
+    def search(self, query: str, k: int = 10, mask: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return (chunk_ids, scores) of the top-k BM25 matches, best first.
+        `mask` is an optional boolean array over chunk IDs restricting the candidates.
+        """
+        term_ids = [self.vocab[term] for term in set(tokenize(query)) if term in self.vocab]
+        if not term_ids:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+
+        ids_parts, score_parts = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            ids = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype("float32")
+            if mask is not None:
+                keep = mask[ids]
+                ids, tf = ids[keep], tf[keep]
+            ids_parts.append(ids)
+            score_parts.append(self._idf[term_id] * tf * (self.k1 + 1) / (tf + self._norm[ids]))
+
+        ids = np.concatenate(ids_parts)
+        if len(ids) == 0:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(score_parts)).astype("float32")
+
+        if len(totals) > k:
+            top = np.argpartition(-totals, k)[:k]
+        else:
+            top = np.arange(len(totals))
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return unique_ids[top].astype("int64"), totals[top]
+
+    def save(self, path: str):
+        terms = np.array(sorted(self.vocab, key=self.vocab.get), dtype=str)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=terms,
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                tfs=self.tfs,
+                doc_lengths=self.doc_lengths,
+                params=np.array([self.k1, self.b], dtype="float64")
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            k1, b = data["params"]
+            index = cls(k1=float(k1), b=float(b))
+            index.vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+            index.offsets = data["offsets"]
+            index.doc_ids = data["doc_ids"]
+            index.tfs = data["tfs"]
+            index.doc_lengths = data["doc_lengths"]
+        index._size = len(index.doc_lengths)
+        index._finalize()
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list[tuple[int, float]]:
+    """
+    Fuse several best-first lists of chunk IDs.
+    Returns (chunk_id, fused score) pairs sorted by fused score, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+# from vectorstore.lexical import BM25Index
+
+# bm25 = BM25Index()
+# bm25.add([0, 1], ["Arista 7050X3 switch datasheet", "EOS 4.32 release notes"])
+# ids, scores = bm25.search("7050X3 power specs", k=5)
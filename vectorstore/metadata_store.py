@@ -0,0 +1,242 @@
+# vectorstore/metadata_store.py
+
+import os
+import mmap
+import shutil
+import numpy as np
+
+from vectorstore.artifacts import load_json, save_json
+
+# One fixed-width row per chunk ID; source == -1 marks a removed chunk
+CHUNK_DTYPE = np.dtype([
+    ("source", "<i4"),
+    ("chunk_index", "<i4"),
+    ("total_chunks", "<i4"),
+    ("char_start", "<i8"),
+    ("char_end", "<i8"),
+    ("text_start", "<i8"),
+    ("text_end", "<i8"),
+])
+
+TEXT_FILE = "text.bin"
+CHUNKS_FILE = "chunks.npy"
+SOURCES_FILE = "sources.json"
+DUPLICATES_FILE = "duplicates.json"
+
+# Per-file fields, stored once per source instead of once per chunk
+SOURCE_FIELDS = ("source", "filename", "file_type", "category", "file_modified_time")
+
+
+class MetadataStore:
+    """
+    Columnar chunk store: one UTF-8 text blob plus fixed-width numeric columns.
+
+    Layout of the store directory:
+        text.bin      chunk texts back to back (append-only)
+        chunks.npy    structured array, one row per chunk ID (memory-mapped)
+        sources.json  dictionary of per-file fields referenced by chunks["source"]
+        duplicates.json  other locations of chunks that near-duplicates were collapsed into
+
+    Both large files are memory-mapped read-only, so opening a store is
+    near-instant and worker processes share the same page cache. Chunks are
+    decoded lazily by ID through the `documents` and `metadatas` views, which
+    behave like the lists the pickle format used to hold (None for removed IDs).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending_rows = []
+        self._pending_deletes = []
+        self._load()
+        self.documents = _DocumentView(self)
+        self.metadatas = _MetadataView(self)
+
+    @classmethod
+    def create(cls, path: str):
+        """Start an empty store at `path`, replacing any existing one."""
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        os.makedirs(path)
+        open(os.path.join(path, TEXT_FILE), "wb").close()
+        np.save(os.path.join(path, CHUNKS_FILE), np.empty(0, dtype=CHUNK_DTYPE))
+        save_json(os.path.join(path, SOURCES_FILE), [])
+        return cls(path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, CHUNKS_FILE))
+
+    def _load(self):
+        self.chunks = np.load(os.path.join(self.path, CHUNKS_FILE), mmap_mode="r")
+        self.sources = load_json(os.path.join(self.path, SOURCES_FILE), [])
+        self._source_codes = {record["source"]: code for code, record in enumerate(self.sources)}
+        # {chunk_id: [[source_code, chunk_index, char_start, char_end], ...]}
+        self.duplicates = {int(chunk_id): locations for chunk_id, locations in load_json(os.path.join(self.path, DUPLICATES_FILE), {}).items()}
+
+        text_path = os.path.join(self.path, TEXT_FILE)
+        self._text_size = os.path.getsize(text_path)
+        if self._text_size:
+            with open(text_path, "rb") as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @property
+    def source_codes(self) -> np.ndarray:
+        return self.chunks["source"]
+
+    def get_text(self, chunk_id: int):
+        row = self.chunks[chunk_id]
+        if row["source"] < 0:
+            return None
+        return self._text[row["text_start"]:row["text_end"]].decode("utf-8")
+
+    def get_metadata(self, chunk_id: int):
+        row = self.chunks[chunk_id]
+        if row["source"] < 0:
+            return None
+        meta = dict(self.sources[row["source"]])
+        preview = self._text[row["text_start"]:min(row["text_end"], row["text_start"] + 200)].decode("utf-8", errors="ignore")[:50]
+        meta.update({
+            "chunk_index": int(row["chunk_index"]),
+            "total_chunks": int(row["total_chunks"]),
+            "chunk_char_start": int(row["char_start"]),
+            "chunk_char_end": int(row["char_end"]),
+            "content_preview": preview + ("..." if row["char_end"] - row["char_start"] > 50 else ""),
+            "chunk_id": int(chunk_id)
+        })
+        if int(chunk_id) in self.duplicates:
+            meta["duplicate_locations"] = [
+                {
+                    "source": self.sources[code]["source"],
+                    "filename": self.sources[code]["filename"],
+                    "chunk_index": chunk_index,
+                    "chunk_char_start": char_start,
+                    "chunk_char_end": char_end
+                }
+                for code, chunk_index, char_start, char_end in self.duplicates[int(chunk_id)]
+            ]
+        return meta
+
+    # === Writing ===
+
+    def _source_code(self, meta: dict) -> int:
+        code = self._source_codes.get(meta["source"])
+        record = {field: meta.get(field) for field in SOURCE_FIELDS}
+        if code is None:
+            code = self._source_codes[meta["source"]] = len(self.sources)
+            self.sources.append(record)
+        else:
+            self.sources[code] = record
+        return code
+
+    def append(self, documents: list[str], metadatas: list[dict]):
+        """Append chunks; their IDs continue from the current end of the store (pending rows included)."""
+        rows = np.empty(len(documents), dtype=CHUNK_DTYPE)
+        blobs = []
+        text_offset = self._text_size
+        for i, (doc, meta) in enumerate(zip(documents, metadatas)):
+            blob = doc.encode("utf-8")
+            blobs.append(blob)
+            rows[i] = (
+                self._source_code(meta),
+                meta["chunk_index"],
+                meta["total_chunks"],
+                meta["chunk_char_start"],
+                meta["chunk_char_end"],
+                text_offset,
+                text_offset + len(blob)
+            )
+            text_offset += len(blob)
+
+        with open(os.path.join(self.path, TEXT_FILE), "ab") as f:
+            f.write(b"".join(blobs))
+        self._text_size = text_offset
+        self._pending_rows.append(rows)
+
+    def add_duplicates(self, duplicates: list[tuple[int, dict]]):
+        """Record (chunk_id, metadata) pairs: chunks that were collapsed into an existing chunk ID."""
+        for chunk_id, meta in duplicates:
+            self.duplicates.setdefault(int(chunk_id), []).append(
+                [self._source_code(meta), meta["chunk_index"], meta["chunk_char_start"], meta["chunk_char_end"]]
+            )
+
+    def drop_duplicate_locations(self, sources):
+        """Forget the duplicate locations recorded for these source files."""
+        codes = {self._source_codes[source] for source in sources if source in self._source_codes}
+        for chunk_id in list(self.duplicates):
+            locations = [location for location in self.duplicates[chunk_id] if location[0] not in codes]
+            if locations:
+                self.duplicates[chunk_id] = locations
+            else:
+                del self.duplicates[chunk_id]
+
+    def next_id(self) -> int:
+        return len(self.chunks) + sum(len(rows) for rows in self._pending_rows)
+
+    def delete(self, chunk_ids):
+        """Mark chunk IDs as removed; their text stays in the blob until the next full build."""
+        self._pending_deletes.extend(int(chunk_id) for chunk_id in chunk_ids)
+        for chunk_id in chunk_ids:
+            self.duplicates.pop(int(chunk_id), None)
+
+    def set_file_modified_time(self, source: str, modified_time: str):
+        code = self._source_codes.get(source)
+        if code is not None:
+            self.sources[code]["file_modified_time"] = modified_time
+
+    def flush(self):
+        """Write pending appends/deletes and source records, then remap the store."""
+        chunks = np.concatenate([np.array(self.chunks)] + self._pending_rows)
+        if self._pending_deletes:
+            chunks["source"][np.array(self._pending_deletes, dtype="int64")] = -1
+        self._pending_rows, self._pending_deletes = [], []
+
+        chunks_path = os.path.join(self.path, CHUNKS_FILE)
+        tmp_path = os.path.join(self.path, f"tmp_{CHUNKS_FILE}")
+        np.save(tmp_path, chunks)
+        os.replace(tmp_path, chunks_path)
+        save_json(os.path.join(self.path, SOURCES_FILE), self.sources)
+        save_json(os.path.join(self.path, DUPLICATES_FILE), {str(chunk_id): locations for chunk_id, locations in self.duplicates.items()})
+        self._load()
+
+
+class _DocumentView:
+    """List-like, lazily decoded view of chunk texts by chunk ID."""
+
+    def __init__(self, store: MetadataStore):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, chunk_id):
+        if isinstance(chunk_id, slice):
+            return [self._store.get_text(i) for i in range(*chunk_id.indices(len(self)))]
+        return self._store.get_text(int(chunk_id))
+
+    def __iter__(self):
+        return (self._store.get_text(i) for i in range(len(self)))
+
+
+class _MetadataView(_DocumentView):
+    """List-like, lazily built view of chunk metadata dicts by chunk ID."""
+
+    def __getitem__(self, chunk_id):
+        if isinstance(chunk_id, slice):
+            return [self._store.get_metadata(i) for i in range(*chunk_id.indices(len(self)))]
+        return self._store.get_metadata(int(chunk_id))
+
+    def __iter__(self):
+        return (self._store.get_metadata(i) for i in range(len(self)))
+
+
+# from vectorstore.metadata_store import MetadataStore
+
+# store = MetadataStore("metadata_store")
+# print(store.documents[42][:100], store.metadatas[42]["source"])
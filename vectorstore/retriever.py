@@ -1,11 +1,126 @@
 # vectorstore/retriever.py
 
 import os
+import time
+import heapq
+import threading
+import contextvars
 import faiss
 import pickle
 import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
-from vectorstore.embedding import get_cached_embedding
+from vectorstore.embedding import get_cached_embedding, embed_queries
+from vectorstore.artifacts import artifact_path, load_json, load_vectors
+from vectorstore.ann import apply_search_params, prepare_vectors, normalize, is_cosine
+from vectorstore.lexical import BM25Index, reciprocal_rank_fusion
+from vectorstore.filters import FilterColumns
+from vectorstore.metadata_store import MetadataStore
+from vectorstore.versions import IndexVersions
+
+# Global chunk ID = (shard number << SHARD_ID_BITS) | chunk ID within the shard
+SHARD_ID_BITS = 32
+LOCAL_ID_MASK = (1 << SHARD_ID_BITS) - 1
+
+# Seconds between checks for a newly published index version
+RELOAD_INTERVAL = 5.0
+
+# MMR trade-off: 1.0 ranks by relevance only, lower values favour chunks unlike those already picked
+MMR_LAMBDA = 0.7
+
+
+class _Shard:
+    """One FAISS index with its metadata store, vectors file and BM25 index."""
+
+    def __init__(self, name, index_paths, metadata_paths, use_lexical=True):
+        self.name = name
+        self.version = None
+        self.search_params = {}
+        self.vectors = None
+        self.lexical = None
+        self.index = self._load_index(index_paths, use_lexical)
+        self.documents, self.metadatas = self._load_metadata(metadata_paths)
+
+    def _load_index(self, index_paths, use_lexical):
+        for path in index_paths:
+            if os.path.exists(path):
+                print(f"[INFO] Loading FAISS index from: {path}")
+                index = faiss.read_index(path)
+                # nprobe / efSearch persisted by build_index for approximate index types
+                self.search_params = load_json(artifact_path(path, "params.json"), {})
+                apply_search_params(index, self.search_params)
+                # Unit vectors aligned with chunk IDs (memory-mapped), used for reranking
+                self.vectors = load_vectors(artifact_path(path, "vectors.f32"), index.d)
+                bm25_path = artifact_path(path, "bm25.npz")
+                if use_lexical and os.path.exists(bm25_path):
+                    self.lexical = BM25Index.load(bm25_path)
+                return index
+        raise FileNotFoundError(f"FAISS index file not found in expected locations: {index_paths}")
+
+    def _load_metadata(self, metadata_paths):
+        for path in metadata_paths:
+            if MetadataStore.exists(path):
+                print(f"[INFO] Loading metadata store from: {path}")
+                store = MetadataStore(path)
+                self.filter_columns = FilterColumns(store.source_codes, store.sources)
+                return store.documents, store.metadatas
+            if os.path.isfile(path):
+                print(f"[INFO] Loading metadata from: {path}")
+                with open(path, "rb") as f:
+                    store = pickle.load(f)
+                self.filter_columns = FilterColumns.from_metadatas(store["metadatas"])
+                return store["documents"], store["metadatas"]
+        raise FileNotFoundError(f"Metadata file not found in expected locations: {metadata_paths}")
+
+    def search_parameters(self, selector):
+        """FAISS search parameters carrying `selector`, typed for the underlying index."""
+        base = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexIDMap) else self.index
+        if isinstance(base, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+
+    def dense_search(self, query_vecs, k, bitmap=None):
+        """Return (D, I, seconds); I holds chunk IDs local to this shard."""
+        start = time.perf_counter()
+        search_params = None
+        if bitmap is not None:
+            selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+            search_params = self.search_parameters(selector)
+        D, I = self.index.search(query_vecs, k, params=search_params)
+        return D, I, time.perf_counter() - start
+
+    def lexical_search(self, query, k, mask=None):
+        start = time.perf_counter()
+        ids, scores = self.lexical.search(query, k, mask)
+        return ids, scores, time.perf_counter() - start
+
+    def chunk_vectors(self, chunk_ids):
+        """Unit vectors of `chunk_ids`, one row each."""
+        if self.vectors is None:
+            return normalize(np.array([get_cached_embedding(self.documents[idx]) for idx in chunk_ids], dtype="float32"))
+        return self.vectors[chunk_ids]
+
+    def similarity_to_chunks(self, vector, chunk_ids):
+        return self.chunk_vectors(chunk_ids) @ normalize(vector)[0]
+
+
+class _RetrieverState:
+    """Immutable snapshot of the loaded shards; swapped as a whole on hot reload."""
+
+    def __init__(self, shards):
+        metrics = {shard.search_params.get("metric", "l2") for shard in shards}
+        if len(metrics) > 1:
+            raise ValueError(f"Shards must share one metric to be merged, found {sorted(metrics)}")
+        self.shards = shards
+        self.search_params = shards[0].search_params
+        self.documents = _ShardedDocuments(shards)
+        self.metadatas = _ShardedMetadatas(shards)
+
+    def versions(self):
+        return {shard.name: shard.version for shard in self.shards}
 
 
 class FAISSRetriever:
@@ -13,65 +128,396 @@ class FAISSRetriever:
         self,
         index_paths=None,
         metadata_paths=None,
-        top_k=3
+        top_k=3,
+        use_lexical=True,
+        shards=None,
+        index_root=None,
+        reload_interval=RELOAD_INTERVAL
     ):
+        """
+        Without `shards` or `index_root`, the first existing path of `index_paths`
+        and of `metadata_paths` is loaded as a single index.
+
+        `index_root` is a versioned index directory (see vectorstore.index.publish_index).
+        `shards` maps a shard name (e.g. a source subtree, see
+        vectorstore.index.update_shards) to a versioned index root or to an
+        (index_path, metadata_path) pair; every shard is loaded and searched.
+
+        Versioned indexes are checked every `reload_interval` seconds (None
+        disables the watcher; reload() can still be called). A newly published
+        version is loaded in the background and swapped in atomically; queries
+        already running keep the snapshot they started with.
+        """
         self.index_paths = index_paths or [
             "faiss_index.idx",
             "/content/drive/MyDrive/faiss_index.idx"
         ]
         self.metadata_paths = metadata_paths or [
+            "metadata_store",
+            "/content/drive/MyDrive/metadata_store",
             "metadata.pkl",
             "/content/drive/MyDrive/metadata.pkl"
         ]
         self.top_k = top_k
+        self.use_lexical = use_lexical
 
-        self.index = self._load_index()
-        self.documents, self.metadatas = self._load_metadata()
+        if shards:
+            self._shard_sources = list(shards.items())
+        elif index_root:
+            self._shard_sources = [("default", index_root)]
+        else:
+            self._shard_sources = [("default", (self.index_paths, self.metadata_paths))]
 
-    def _load_index(self):
-        for path in self.index_paths:
-            if os.path.exists(path):
-                print(f"[INFO] Loading FAISS index from: {path}")
-                return faiss.read_index(path)
-        raise FileNotFoundError("FAISS index file not found in expected locations.")
+        self._state = _RetrieverState([self._load_shard(name, source) for name, source in self._shard_sources])
+        self._pinned = contextvars.ContextVar(f"retriever_state_{id(self)}", default=None)
+        self._reload_lock = threading.Lock()
 
-    def _load_metadata(self):
-        for path in self.metadata_paths:
-            if os.path.exists(path):
-                print(f"[INFO] Loading metadata from: {path}")
-                with open(path, "rb") as f:
-                    store = pickle.load(f)
-                return store["documents"], store["metadatas"]
-        raise FileNotFoundError("Metadata file not found in expected locations.")
+        # Latency of each shard's dense / lexical search in the last hybrid_search call
+        self.shard_latency_ms = {}
+
+        # Shard searches (FAISS and BM25 scoring release the GIL in their hot loops) fan out here
+        n_tasks = len(self._shard_sources) * (2 if use_lexical else 1)
+        self._executor = ThreadPoolExecutor(max_workers=n_tasks, thread_name_prefix="retriever")
+
+        self._stop = threading.Event()
+        self._watcher = None
+        if reload_interval and any(isinstance(source, str) for _, source in self._shard_sources):
+            self._watcher = threading.Thread(target=self._watch, args=(reload_interval,), name="retriever-reload", daemon=True)
+            self._watcher.start()
+
+    # === Versions and hot reload ===
+
+    def _load_shard(self, name, source, previous=None):
+        """Load a shard; versioned shards are reused when their published version has not changed."""
+        if not isinstance(source, str):
+            index_paths, metadata_paths = source
+            if isinstance(index_paths, str):
+                index_paths, metadata_paths = [index_paths], [metadata_paths]
+            return previous or _Shard(name, index_paths, metadata_paths, self.use_lexical)
+
+        versions = IndexVersions(source)
+        version = versions.current()
+        if version is None:
+            raise FileNotFoundError(f"No published index version in {source}")
+        if previous is not None and previous.version == version:
+            return previous
+        shard = _Shard(name, [versions.index_path(version)], [versions.metadata_path(version)], self.use_lexical)
+        shard.version = version
+        return shard
 
-    def hybrid_search(self, queries):
+    def reload(self) -> bool:
         """
-        Perform vector search using FAISS for a list of queries.
-        Returns list of (query, document index) tuples.
+        Load any newly published shard versions and swap them in. The active
+        snapshot keeps serving until the new one is fully loaded (double
+        buffering). Returns whether a new snapshot was installed.
         """
-        embeddings = [np.array(get_cached_embedding(q)) for q in queries]
-        results = []
+        with self._reload_lock:
+            state = self._state
+            shards = [
+                self._load_shard(name, source, previous)
+                for (name, source), previous in zip(self._shard_sources, state.shards)
+            ]
+            if all(new is old for new, old in zip(shards, state.shards)):
+                return False
+            self._state = _RetrieverState(shards)
+            print(f"[INFO] Hot-reloaded index versions: {self._state.versions()}")
+            return True
 
-        for i, q_emb in enumerate(embeddings):
-            D, I = self.index.search(np.array([q_emb]).astype("float32"), self.top_k)
-            for idx in I[0]:
-                results.append((queries[i], idx))
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"[ERROR] Index reload failed, still serving {self._state.versions()}: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    @contextmanager
+    def pinned(self):
+        """
+        Pin the current snapshot for the calling context, so a multi-step request
+        (search, rerank, confidence) sees one index version even if a reload lands
+        in between. Chunk IDs returned by hybrid_search are only valid within it.
+        """
+        token = self._pinned.set(self._pinned.get() or self._state)
+        try:
+            yield self._pinned.get()
+        finally:
+            self._pinned.reset(token)
+
+    def _current(self) -> _RetrieverState:
+        return self._pinned.get() or self._state
+
+    @property
+    def shards(self):
+        return self._current().shards
+
+    @property
+    def documents(self):
+        return self._current().documents
+
+    @property
+    def metadatas(self):
+        return self._current().metadatas
+
+    @property
+    def search_params(self):
+        return self._current().search_params
+
+    @property
+    def versions(self):
+        return self._current().versions()
+
+    # === Search ===
+
+    def hybrid_search(self, queries, filters=None, prefetched=None):
+        """
+        Dense + lexical retrieval for a list of queries (the first one is the user's query).
 
-        return list(set(results))  # deduplicate
+        All queries are embedded in one model call; every shard is then searched
+        concurrently with a single multi-query `index.search`, and the shard
+        results are merged with a heap into a global top-k per query. Dense hits
+        are merged per chunk ID keeping the best score and the query that produced
+        it. When BM25 indexes are available they are queried with the user's query
+        in parallel, and both rankings are merged with reciprocal rank fusion.
+
+        `filters` (a MetadataFilter) restricts both searches to matching chunks via
+        a precomputed chunk-ID bitmap applied inside each shard's search, so the
+        top-k is taken over the filtered set only.
+
+        `prefetched` is the result of prefetch() for the user's query; when it
+        matches (same query, filters and index version) only the other queries
+        are searched, and the result is the same as searching all of them here.
+
+        Returns list of (query, global chunk ID, score) tuples, best first. The score
+        is the RRF score when lexical fusion ran, otherwise the FAISS score (cosine
+        similarity for cosine indexes, L2 distance otherwise). Per-shard latencies
+        of the call are left in `shard_latency_ms`.
+        """
+        state = self._current()
+        selections = self._select(state, filters)
+        if not selections:
+            return []
+
+        if prefetched is not None and prefetched.matches(state, queries[:1], filters):
+            D, I, lexical_ids = prefetched.D, prefetched.I, prefetched.lexical_ids
+            latency = {name: dict(shard_latency) for name, shard_latency in prefetched.latency.items()}
+            if len(queries) > 1:
+                rest_D, rest_I, rest_latency = self._dense_search(state, selections, queries[1:])
+                D, I = np.vstack([D, rest_D]), np.vstack([I, rest_I])
+                for name, shard_latency in rest_latency.items():
+                    latency[name]["dense"] += shard_latency["dense"]
+        else:
+            lexical_futures = self._submit_lexical(selections, queries[0]) if queries else []
+            D, I, latency = self._dense_search(state, selections, queries)
+            lexical_ids = self._collect_lexical(lexical_futures, latency)
+        self.shard_latency_ms = latency
+        return self._fuse(state, queries, D, I, lexical_ids)
+
+    def hybrid_search_batch(self, query_lists, filters=None):
+        """
+        hybrid_search() for many questions at once: every query of every list is
+        embedded in one model call and searched with one multi-query
+        `index.search` per shard, and each list's rows are then merged and fused
+        on their own. Returns one hit list per entry of `query_lists`, each the
+        same as hybrid_search(queries, filters) would return.
+        """
+        if not query_lists:
+            return []
+        state = self._current()
+        selections = self._select(state, filters)
+        if not selections:
+            return [[] for _ in query_lists]
+
+        lexical_futures = [self._submit_lexical(selections, queries[0]) if queries else [] for queries in query_lists]
+        D, I, latency = self._dense_search(state, selections, [query for queries in query_lists for query in queries])
+        results, row = [], 0
+        for queries, futures in zip(query_lists, lexical_futures):
+            lexical_ids = self._collect_lexical(futures, latency)
+            results.append(self._fuse(state, queries, D[row:row + len(queries)], I[row:row + len(queries)], lexical_ids))
+            row += len(queries)
+        self.shard_latency_ms = latency
+        return results
+
+    def _fuse(self, state, queries, D, I, lexical_ids):
+        """Best dense hit per chunk, rank-fused with the lexical top-k when there is one."""
+        dense_hits = self._merge_hits(queries, D, I, is_cosine(state.search_params))
+        if lexical_ids is None:
+            return dense_hits
+
+        hit_queries = {idx: query for query, idx, _ in dense_hits}
+        fused = reciprocal_rank_fusion([[idx for _, idx, _ in dense_hits], lexical_ids])
+        return [(hit_queries.get(idx, queries[0]), idx, score) for idx, score in fused]
+
+    def prefetch(self, query, filters=None):
+        """
+        Search for the user's query alone, ahead of its paraphrases; pass the
+        result to hybrid_search(..., prefetched=...) to reuse it.
+        """
+        state = self._current()
+        selections = self._select(state, filters)
+        if not selections:
+            return None
+        lexical_futures = self._submit_lexical(selections, query)
+        D, I, latency = self._dense_search(state, selections, [query])
+        return _Prefetched(state, query, filters, D, I, self._collect_lexical(lexical_futures, latency), latency)
+
+    def _select(self, state, filters):
+        """(shard number, shard, mask, bitmap) of every shard with chunks passing `filters`."""
+        selections = []
+        for shard_no, shard in enumerate(state.shards):
+            mask = bitmap = None
+            if filters is not None:
+                mask, bitmap = shard.filter_columns.select(filters)
+                if not mask.any():
+                    continue
+            selections.append((shard_no, shard, mask, bitmap))
+        return selections
+
+    def _submit_lexical(self, selections, query):
+        return [
+            (shard_no, shard, self._executor.submit(shard.lexical_search, query, self.top_k, mask))
+            for shard_no, shard, mask, _ in selections if shard.lexical is not None
+        ]
+
+    def _collect_lexical(self, lexical_futures, latency):
+        """Global lexical top-k chunk IDs, or None without BM25 indexes."""
+        if not lexical_futures:
+            return None
+        lexical_lists = []
+        for shard_no, shard, future in lexical_futures:
+            ids, scores, seconds = future.result()
+            latency[shard.name]["lexical"] = seconds * 1000
+            lexical_lists.append(zip(scores.tolist(), _global_ids(shard_no, ids).tolist()))
+
+        # BM25 scores use per-shard statistics, close enough to pick a global top-k for rank fusion
+        return [idx for _, idx in heapq.nlargest(self.top_k, (hit for hits in lexical_lists for hit in hits))]
+
+    def _dense_search(self, state, selections, queries):
+        """Embed `queries` and search every selected shard; returns global top-k (D, I) per query and latencies."""
+        query_vecs = prepare_vectors(embed_queries(queries), state.search_params)
+        dense_futures = [
+            (shard_no, shard, self._executor.submit(shard.dense_search, query_vecs, self.top_k, bitmap))
+            for shard_no, shard, _, bitmap in selections
+        ]
+
+        latency = {}
+        shard_results = []
+        for shard_no, shard, future in dense_futures:
+            D, I, seconds = future.result()
+            latency[shard.name] = {"dense": seconds * 1000}
+            shard_results.append((D, _global_ids(shard_no, I)))
+        D, I = self._merge_shards(shard_results, is_cosine(state.search_params))
+        return D, I, latency
+
+    def _merge_shards(self, shard_results, higher_is_better):
+        """Heap-merge per-shard (D, I) results into one global top-k (D, I) per query."""
+        if len(shard_results) == 1:
+            return shard_results[0]
+        select = heapq.nlargest if higher_is_better else heapq.nsmallest
+        n_queries = shard_results[0][0].shape[0]
+        D = np.full((n_queries, self.top_k), -np.inf if higher_is_better else np.inf, dtype="float32")
+        I = np.full((n_queries, self.top_k), -1, dtype="int64")
+        for q in range(n_queries):
+            candidates = (
+                (float(score), int(idx))
+                for shard_D, shard_I in shard_results
+                for score, idx in zip(shard_D[q], shard_I[q]) if idx != -1
+            )
+            for rank, (score, idx) in enumerate(select(self.top_k, candidates)):
+                D[q, rank], I[q, rank] = score, idx
+        return D, I
+
+    def _merge_hits(self, queries, D, I, higher_is_better):
+        """Collapse a (n_queries, k) search result to one entry per chunk ID with its best score."""
+        query_rows = np.repeat(np.arange(len(queries)), I.shape[1])
+        ids, scores = I.ravel(), D.ravel()
+        valid = ids != -1
+        query_rows, ids, scores = query_rows[valid], ids[valid], scores[valid]
+
+        order = np.argsort(-scores if higher_is_better else scores, kind="stable")
+        _, first = np.unique(ids[order], return_index=True)
+        best = order[np.sort(first)]
+
+        return [(queries[q], int(idx), float(score)) for q, idx, score in zip(query_rows[best], ids[best], scores[best])]
+
+    def similarity_to_chunks(self, vector, chunk_ids):
+        """
+        Cosine similarity between `vector` and the stored vectors of `chunk_ids`
+        (global IDs), computed per shard as one matrix-vector product over the
+        memory-mapped vector file. Falls back to embedding the chunk texts for
+        indexes built without one.
+        """
+        shards = self._current().shards
+        chunk_ids = np.asarray(chunk_ids, dtype="int64")
+        similarities = np.empty(len(chunk_ids), dtype="float32")
+        if len(chunk_ids) == 0:
+            return similarities
+        shard_nos = chunk_ids >> SHARD_ID_BITS
+        for shard_no in np.unique(shard_nos):
+            rows = np.flatnonzero(shard_nos == shard_no)
+            similarities[rows] = shards[shard_no].similarity_to_chunks(vector, chunk_ids[rows] & LOCAL_ID_MASK)
+        return similarities
+
+    def chunk_vectors(self, chunk_ids):
+        """Stored unit vectors of `chunk_ids` (global IDs) as one (n, d) matrix, gathered per shard."""
+        shards = self._current().shards
+        chunk_ids = np.asarray(chunk_ids, dtype="int64")
+        vectors = np.empty((len(chunk_ids), shards[0].index.d), dtype="float32")
+        shard_nos = chunk_ids >> SHARD_ID_BITS
+        for shard_no in np.unique(shard_nos):
+            rows = np.flatnonzero(shard_nos == shard_no)
+            vectors[rows] = shards[shard_no].chunk_vectors(chunk_ids[rows] & LOCAL_ID_MASK)
+        return vectors
+
+    def mmr(self, reranked, k=3, lambda_mult=MMR_LAMBDA):
+        """
+        Maximal Marginal Relevance selection of `k` hits from rerank() output.
+
+        Each step picks the hit maximising
+            lambda_mult * relevance - (1 - lambda_mult) * max similarity to the hits already picked,
+        with the rerank scores as relevance. The pairwise similarities come from
+        one matrix product over the stored chunk vectors, and each step is a
+        vectorized update of the running maximum, so selection costs well under
+        a millisecond for a few hundred candidates.
+        Returns the selected (score, document_text, metadata) tuples in pick order.
+        """
+        if len(reranked) <= 1 or k <= 0:
+            return list(reranked[:k])
+        vectors = self.chunk_vectors([meta["chunk_id"] for _, _, meta in reranked])
+        similarity = vectors @ vectors.T
+        relevance = np.array([score for score, _, _ in reranked], dtype="float32")
+
+        selected = [int(np.argmax(relevance))]
+        max_similarity = similarity[selected[0]].copy()
+        available = np.ones(len(reranked), dtype=bool)
+        available[selected[0]] = False
+        while len(selected) < min(k, len(reranked)):
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+            scores[~available] = -np.inf
+            pick = int(np.argmax(scores))
+            selected.append(pick)
+            available[pick] = False
+            np.maximum(max_similarity, similarity[pick], out=max_similarity)
+        return [reranked[i] for i in selected]
 
     def rerank(self, query, query_idx_list):
         """
-        Rerank retrieved document chunks using cosine similarity.
+        Rerank retrieved document chunks using cosine similarity against the
+        stored chunk vectors; only the query itself is embedded.
         Returns list of (score, document_text, metadata).
         """
+        state = self._current()
         query_vec = np.array(get_cached_embedding(query))
-        scored = []
+        chunk_ids = [hit[1] for hit in query_idx_list]
+        similarities = self.similarity_to_chunks(query_vec, chunk_ids)
 
-        for _, idx in query_idx_list:
-            doc = self.documents[idx]
-            doc_vec = np.array(get_cached_embedding(doc))
-            similarity = self.cosine_similarity(query_vec, doc_vec)
-            scored.append((similarity, doc, self.metadatas[idx]))
+        scored = [
+            (float(similarity), state.documents[idx], state.metadatas[idx])
+            for similarity, idx in zip(similarities, chunk_ids)
+        ]
 
         return sorted(scored, key=lambda x: x[0], reverse=True)
 
@@ -80,6 +526,60 @@ class FAISSRetriever:
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
+class _Prefetched:
+    """Dense rows and lexical ranking of the user's query, computed by FAISSRetriever.prefetch."""
+
+    def __init__(self, state, query, filters, D, I, lexical_ids, latency):
+        self.state = state
+        self.query = query
+        self.filter_key = filters.key() if filters is not None else None
+        self.D = D
+        self.I = I
+        self.lexical_ids = lexical_ids
+        self.latency = latency
+
+    def matches(self, state, queries, filters) -> bool:
+        return (
+            state is self.state
+            and list(queries) == [self.query]
+            and (filters.key() if filters is not None else None) == self.filter_key
+        )
+
+
+def _global_ids(shard_no, local_ids):
+    local_ids = np.asarray(local_ids, dtype="int64")
+    return np.where(local_ids < 0, -1, (shard_no << SHARD_ID_BITS) | local_ids)
+
+
+class _ShardedDocuments:
+    """Chunk texts by global chunk ID."""
+
+    def __init__(self, shards):
+        self._shards = shards
+
+    def __len__(self):
+        return sum(len(shard.documents) for shard in self._shards)
+
+    def __getitem__(self, chunk_id):
+        chunk_id = int(chunk_id)
+        return self._shards[chunk_id >> SHARD_ID_BITS].documents[chunk_id & LOCAL_ID_MASK]
+
+
+class _ShardedMetadatas(_ShardedDocuments):
+    """Chunk metadata by global chunk ID; `chunk_id` in the returned dict is the global ID."""
+
+    def __getitem__(self, chunk_id):
+        chunk_id = int(chunk_id)
+        shard = self._shards[chunk_id >> SHARD_ID_BITS]
+        meta = shard.metadatas[chunk_id & LOCAL_ID_MASK]
+        if meta is None:
+            return None
+        meta = dict(meta, chunk_id=chunk_id)
+        if len(self._shards) > 1:
+            meta["shard"] = shard.name
+        return meta
+
+
 
 # from vectorstore.retriever import FAISSRetriever
 
@@ -91,3 +591,10 @@ class FAISSRetriever:
 
 # for score, doc, meta in ranked_results[:3]:
 #     print(f"[{score:.4f}] {meta['filename']}: {doc[:100]}...")
+
+# sharded = FAISSRetriever(top_k=5, shards={
+#     "arista/support": ("shards/arista_support.idx", "shards/arista_support_metadata_store"),
+#     "arista/products": ("shards/arista_products.idx", "shards/arista_products_metadata_store"),
+# })
+# hits = sharded.hybrid_search([query])
+# print(sharded.shard_latency_ms)
@@ -0,0 +1,112 @@
+# vectorstore/versions.py
+
+import os
+import shutil
+from datetime import datetime
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+INDEX_FILE = "faiss_index.idx"
+METADATA_DIR = "metadata_store"
+KEEP_VERSIONS = 3
+
+
+class IndexVersions:
+    """
+    Versioned index directory with an atomic "current" pointer.
+
+    Layout of `root`:
+        versions/<timestamp>/faiss_index.idx (+ sidecars)
+        versions/<timestamp>/metadata_store/
+        CURRENT               name of the published version
+
+    A build writes a complete new version directory and only then publishes it
+    by replacing CURRENT (write to a temp file + os.replace), so readers see
+    either the old or the new version, never a half-written one.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.versions_dir = os.path.join(root, VERSIONS_DIR)
+
+    @staticmethod
+    def exists(root: str) -> bool:
+        return os.path.isfile(os.path.join(root, CURRENT_FILE))
+
+    def current(self):
+        """Name of the published version, or None before the first publish."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def index_path(self, version: str) -> str:
+        return os.path.join(self.path(version), INDEX_FILE)
+
+    def metadata_path(self, version: str) -> str:
+        return os.path.join(self.path(version), METADATA_DIR)
+
+    def new_version(self, base: str = None, copy=()) -> str:
+        """
+        Create an unpublished version directory, optionally starting from `base`.
+
+        Files of `base` are hard-linked, so starting from it costs neither disk
+        space nor I/O; the paths in `copy` (relative to the version directory),
+        which the caller modifies in place, get a private copy instead. Every
+        other file must only ever be replaced (temp file + os.replace) in the
+        new version, or the change would show through in `base`.
+        """
+        os.makedirs(self.versions_dir, exist_ok=True)
+        version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        if base:
+            base_path = self.path(base)
+            private = {os.path.normpath(os.path.join(base_path, name)) for name in copy}
+
+            def link_or_copy(src, dst):
+                if os.path.normpath(src) not in private:
+                    try:
+                        os.link(src, dst)
+                        return dst
+                    except OSError:
+                        pass  # e.g. a filesystem without hard links
+                return shutil.copy2(src, dst)
+
+            shutil.copytree(base_path, self.path(version), copy_function=link_or_copy)
+        else:
+            os.makedirs(self.path(version))
+        return version
+
+    def publish(self, version: str):
+        """Atomically point CURRENT at `version`."""
+        current_path = os.path.join(self.root, CURRENT_FILE)
+        tmp_path = f"{current_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, current_path)
+
+    def discard(self, version: str):
+        shutil.rmtree(self.path(version), ignore_errors=True)
+
+    def prune(self, keep: int = KEEP_VERSIONS):
+        """
+        Delete versions older than the `keep` most recent ones up to the current
+        version. Newer, unpublished versions may be builds in progress and are left alone.
+        """
+        current = self.current()
+        if current is None or not os.path.isdir(self.versions_dir):
+            return
+        older = sorted(version for version in os.listdir(self.versions_dir) if version <= current)
+        for version in older[:-keep]:
+            self.discard(version)
+
+
+# from vectorstore.versions import IndexVersions
+
+# versions = IndexVersions("vector_index")
+# print(versions.current(), versions.index_path(versions.current()))